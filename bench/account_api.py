@@ -0,0 +1,61 @@
+"""Cost of /account/feeds against the number of feeds an account owns.
+
+    python -m bench.account_api [messages per feed]
+
+Registers accounts of 1, 10 and 50 feeds for three users and fetches
+/account/feeds for each: totals only, with the newest 5 entries, and with
+their bodies too. Reports latency and datastore and memcache calls per
+request, first with cold caches and then warm (conditional GETs are not
+sent, so every request builds the response).
+"""
+import os, sys, time
+from bench import gae
+
+SIZES = (1, 10, 50)
+QUERIES = (('totals', '?entries=0'), ('entries', '?entries=5'), ('bodies', '?entries=5&bodies=1'))
+
+calls = {}
+
+def count(service, call, request, response):
+    calls[service] = calls.get(service, 0) + 1
+
+def seed(owner, feeds, messages):
+    from google.appengine.api import users
+    from models.models import UserDetails
+    from util import FeedStats
+    for i in range(feeds):
+        feed_url = gae.seed_feed("%s%03d" % (owner, i), messages, body_size=5000)
+        account = UserDetails.gql("WHERE feedUrl = :1", feed_url).get()
+        account.accountName = users.User(owner + "@example.com")
+        account.put()
+        FeedStats.add(feed_url, messages, messages * 5000)
+
+def measure(owner, query):
+    os.environ['USER_EMAIL'] = owner + "@example.com"
+    os.environ['USER_ID'] = owner
+    calls.clear()
+    started = time.time()
+    status, headers, body = gae.request('/account/feeds' + query)
+    elapsed = time.time() - started
+    assert status == 200, body
+    return elapsed, calls.get('datastore_v3', 0), calls.get('memcache', 0), len(body)
+
+def main():
+    messages = len(sys.argv) > 1 and int(sys.argv[1]) or 10
+    gae.setup()
+    from google.appengine.api import apiproxy_stub_map, memcache
+    apiproxy_stub_map.apiproxy.GetPostCallHooks().Append('bench', count)
+    for feeds in SIZES:
+        seed("owner%d" % feeds, feeds, messages)
+    for cache in ("cold", "warm"):
+        print cache
+        for name, query in QUERIES:
+            for feeds in SIZES:
+                if cache == "cold":
+                    memcache.flush_all()
+                elapsed, datastore, memcache_calls, size = measure("owner%d" % feeds, query)
+                print "  %-8s %3d feeds  %7.1f ms  %3d datastore  %3d memcache  %8d bytes" % (
+                    name, feeds, elapsed * 1000, datastore, memcache_calls, size)
+
+if __name__ == "__main__":
+    main()
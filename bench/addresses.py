@@ -0,0 +1,54 @@
+"""Recipient routing of a batch of deliveries.
+
+    python -m bench.addresses [forwarding rules per message] [messages]
+
+Each message is one delivery, the way the mail service posts it: to one
+envelope address, a local account or an unknown local name, with an
+X-Forwarded-To header naming feed addresses its forwarding rules send it
+to. Reports routing time per message and the account queries needed to
+route a batch, cold and warm.
+"""
+import datetime, sys, time
+from bench import gae
+
+ACCOUNTS = 50
+
+def delivery(rules, n, domain):
+    if n % 3 == 2:
+        envelope = 'nobody%d%s' % (n, domain)
+    else:
+        envelope = 'route%02d%s' % (n % ACCOUNTS, domain)
+    forwarded = ", ".join(['route%02d%s' % ((n + i + 1) % ACCOUNTS, domain) for i in range(rules)])
+    return envelope, forwarded
+
+def main():
+    rules = len(sys.argv) > 1 and int(sys.argv[1]) or 1
+    count = len(sys.argv) > 2 and int(sys.argv[2]) or 100
+    gae.setup()
+    import config
+    from util import Accounts, Addresses, Ingest
+    for i in range(ACCOUNTS):
+        gae.seed_feed("route%02d" % i, 0)
+    domain = config.SETTINGS['emaildomain']
+    samples = [delivery(rules, i, domain) for i in range(count)]
+
+    start = time.time()
+    batch = []
+    for envelope, forwarded in samples:
+        batch.append({'recipients': Addresses.route(envelope, forwarded), 'sender': 'list@example.org',
+                      'messageId': '', 'subject': 'Digest', 'body': 'body', 'dateSent': None, 'dateReceived': datetime.datetime.now()})
+    routed = time.time() - start
+    print "route: %.3f ms per message with %d forwarding rules" % (routed * 1000 / count, rules)
+
+    for run in ("cold", "warm"):
+        if run == "cold":
+            Accounts._index.clear()
+        queries = Accounts.stats['queries']
+        start = time.time()
+        stored = Ingest.store([dict(pending) for pending in batch])
+        elapsed = time.time() - start
+        print "%s: %d messages stored in %.1f ms, %d account queries" % (
+            run, stored, elapsed * 1000, Accounts.stats['queries'] - queries)
+
+if __name__ == "__main__":
+    main()
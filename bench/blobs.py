@@ -0,0 +1,72 @@
+"""Stored body and feed sizes with images and attachments offloaded to blobs.
+
+    python -m bench.blobs [messages]
+
+Mails [messages] newsletters to one feed, each with the same logo as a
+data: URI, a cid: image of its own and a PDF attachment, the way the mail
+service posts them to /_ah/mail/, and runs the ingest worker. Then reports
+the stored body bytes, the RSS and Atom feed sizes and the blobs written.
+Runs twice: with BLOB_MAX_BYTES at 0, which keeps every data: URI in the
+body as before, and with the configured limit.
+"""
+import base64, random, sys
+from email.mime.application import MIMEApplication
+from email.mime.image import MIMEImage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from bench import gae
+
+LOGO_BYTES = 20 * 1024
+IMAGE_BYTES = 60 * 1024
+PDF_BYTES = 200 * 1024
+
+def newsletter(address, i, logo):
+    message = MIMEMultipart('related')
+    message['From'] = 'List <list@example.com>'
+    message['To'] = address
+    message['Subject'] = 'Issue %d' % i
+    html = '<img src="data:image/png;base64,%s">%s<img src="cid:chart%d@bench">' % (
+        base64.b64encode(logo), gae.sample_body(20000), i)
+    message.attach(MIMEText(html, 'html'))
+    image = MIMEImage(random_bytes(IMAGE_BYTES), 'png')
+    image['Content-ID'] = '<chart%d@bench>' % i
+    message.attach(image)
+    attachment = MIMEApplication(random_bytes(PDF_BYTES), 'pdf')
+    attachment.add_header('Content-Disposition', 'attachment', filename='issue%d.pdf' % i)
+    message.attach(attachment)
+    return message.as_string()
+
+def random_bytes(size):
+    return "".join([chr(random.randint(0, 255)) for i in range(size)])
+
+def run(name, messages):
+    import config
+    from models.models import MailBlob, MailMessage
+    from util import Blobs
+    feed_url = gae.seed_feed(name, 0)
+    address = name + config.SETTINGS['emaildomain']
+    logo = random_bytes(LOGO_BYTES)
+    for i in range(messages):
+        gae.request('/_ah/mail/' + address, method='POST', body=newsletter(address, i, logo))
+    gae.request('/tasks/ingest', method='POST')
+    stored = MailMessage.all().filter("toAddress = ", address).fetch(1000)
+    body_bytes = sum([len(message.body.encode('utf-8')) for message in stored])
+    rss = len(gae.request('/rss/' + feed_url)[2])
+    atom = len(gae.request('/' + feed_url)[2])
+    blobs = MailBlob.all().count()
+    print "%-10s %3d messages  bodies %8.1f KB  rss %8.1f KB  atom %8.1f KB  %4d blobs, %d duplicates" % (
+        name, len(stored), body_bytes / 1024.0, rss / 1024.0, atom / 1024.0, blobs, Blobs.stats['duplicates'])
+
+def main():
+    messages = len(sys.argv) > 1 and int(sys.argv[1]) or 20
+    gae.setup()
+    import config
+    random.seed(1)
+    limit = config.SETTINGS['blob_max_bytes']
+    config.SETTINGS['blob_max_bytes'] = 0
+    run("inline", messages)
+    config.SETTINGS['blob_max_bytes'] = limit
+    run("offloaded", messages)
+
+if __name__ == "__main__":
+    main()
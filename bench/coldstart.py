@@ -0,0 +1,66 @@
+"""Cold start cost per route: importing main and the first request.
+
+    python -m bench.coldstart [runs]
+
+Every measurement runs in a new interpreter, as a new instance would: the
+SDK stubs are set up and a feed seeded, then "import main" and the first
+request to one route are timed, and the modules loaded by each counted.
+Each route is measured with handlers loaded on demand (util/Routes.py)
+and again with every handler module imported up front, as main.py used
+to. Reports the median of [runs] interpreters.
+"""
+import subprocess, sys, time
+from email.mime.text import MIMEText
+from bench import gae
+
+FEED = "coldstart"
+ROUTES = (('GET', '/help'), ('GET', '/'), ('GET', '/view/' + FEED + '-bench'), ('GET', '/rss/' + FEED + '-bench'),
+          ('GET', '/' + FEED + '-bench'), ('POST', '/_ah/mail/' + FEED + '@example.com'))
+EAGER = ('util.MailHandler', 'controllers.Misc', 'controllers.Feed', 'controllers.Home', 'controllers.Hub',
+         'controllers.Register', 'controllers.Tasks')
+
+def child(method, path, eager):
+    gae.setup()
+    gae.seed_feed(FEED, 20)
+    modules = len(sys.modules)
+    started = time.time()
+    if eager:
+        for name in EAGER:
+            __import__(name)
+    __import__("main")
+    imported = time.time() - started
+    import_modules = len(sys.modules) - modules
+    body = ''
+    if method == 'POST': #inbound mail
+        message = MIMEText(gae.sample_body(20000), 'html')
+        message['From'] = 'List <list@example.com>'
+        message['To'] = path.split('/')[-1]
+        message['Subject'] = 'Cold start'
+        body = message.as_string()
+    started = time.time()
+    status, headers, output = gae.request(path, method=method, body=body)
+    print "%s %f %f %d %d" % (status, imported, time.time() - started, import_modules, len(sys.modules) - modules)
+
+def measure(method, path, eager, runs):
+    results = []
+    for run in range(runs):
+        output = subprocess.Popen([sys.executable, '-m', 'bench.coldstart', '--child', method, path, eager and '1' or ''],
+                                  cwd=gae.ROOT_DIR, stdout=subprocess.PIPE).communicate()[0]
+        results.append([float(value) for value in output.split()[-5:]])
+    results.sort(key=lambda result: result[1] + result[2])
+    return results[len(results) / 2]
+
+def main():
+    if sys.argv[1:2] == ['--child']:
+        return child(sys.argv[2], sys.argv[3], sys.argv[4] == '1')
+    runs = len(sys.argv) > 1 and int(sys.argv[1]) or 5
+    print "%-40s %-6s %6s %11s %11s %9s" % ("route", "load", "status", "import ms", "request ms", "modules")
+    for method, path in ROUTES:
+        for eager in (True, False):
+            status, imported, request, import_modules, modules = measure(method, path, eager, runs)
+            print "%-40s %-6s %6d %11.1f %11.1f %4d/%4d" % (method + " " + path, eager and "eager" or "lazy",
+                                                            status, imported * 1000, request * 1000,
+                                                            import_modules, modules)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""CPU per feed request against bytes on the wire, per gzip level.
+
+    python -m bench.compression
+
+For each level, polls a feed of newsletter sized messages with
+"Accept-Encoding: gzip": once compressing on every request (the gzip copy
+dropped from the cache each time) and once serving the cached gzip copy.
+The plain rendered document stays cached throughout, so the difference is
+the compression alone.
+"""
+import time
+from bench import gae
+
+MESSAGES = 50
+REQUESTS = 50
+
+def measure(path, drop):
+    from util import FeedCache
+    start = time.clock()
+    for i in range(REQUESTS):
+        if drop:
+            for key in list(FeedCache._cache.map.keys()):
+                if key[1].endswith(":gzip"):
+                    FeedCache._cache.delete(key)
+        status, headers, body = gae.request(path, {'Accept-Encoding': 'gzip'})
+    return (time.clock() - start) / REQUESTS, len(body)
+
+def main():
+    gae.setup()
+    import config
+    feed_url = gae.seed_feed("compression", MESSAGES)
+    for prefix in ("/rss/", "/"):
+        path = prefix + feed_url
+        config.SETTINGS['compression_level'] = 0
+        gae.request(path) #renders and caches the plain document
+        plain_cpu, plain_bytes = measure(path, False)
+        print "%-6s uncompressed      %6.2f ms  %8d bytes" % (prefix, plain_cpu * 1000, plain_bytes)
+        for level in (1, 6, 9):
+            config.SETTINGS['compression_level'] = level
+            every_cpu, size = measure(path, True)
+            cached_cpu, size = measure(path, False)
+            print "%-6s gzip %d  every request %6.2f ms  cached %6.2f ms  %8d bytes (%.1fx smaller)" % (
+                prefix, level, every_cpu * 1000, cached_cpu * 1000, size, float(plain_bytes) / size)
+
+if __name__ == "__main__":
+    main()
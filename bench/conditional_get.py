@@ -0,0 +1,60 @@
+"""Simulates feed readers re-polling feeds, with and without conditional GET.
+
+Every poller fetches its feed once per round; after each round a few feeds
+receive a new message. Clients that send back ETag/Last-Modified validators
+get 304s for unchanged feeds.
+"""
+import random, sys, time
+from bench import gae
+
+FEEDS = 20
+POLLERS_PER_FEED = 25
+ROUNDS = 10
+MESSAGES = 50
+CHANGED_PER_ROUND = 2
+
+def simulate(feeds, conditional):
+    from util import FeedCache
+    random.seed(1)
+    validators = {}
+    sent = requests = not_modified = 0
+    start = time.clock()
+    for round in range(ROUNDS):
+        for feed_url in feeds:
+            for poller in range(POLLERS_PER_FEED):
+                for prefix in ("/rss/", "/"):
+                    path = prefix + feed_url
+                    headers = {}
+                    if conditional and path + str(poller) in validators:
+                        etag, modified = validators[path + str(poller)]
+                        headers['If-None-Match'] = etag
+                        if modified:
+                            headers['If-Modified-Since'] = modified
+                    status, response_headers, body = gae.request(path, headers)
+                    requests += 1
+                    sent += len(body)
+                    if status == 304:
+                        not_modified += 1
+                    else:
+                        validators[path + str(poller)] = (response_headers.get('ETag'),
+                                                          response_headers.get('Last-Modified'))
+        for feed_url in random.sample(feeds, CHANGED_PER_ROUND):
+            FeedCache.invalidate(feed_url)
+    return requests, not_modified, sent, time.clock() - start
+
+def main():
+    gae.setup()
+    feeds = [gae.seed_feed("poller%02d" % i, MESSAGES) for i in range(FEEDS)]
+    results = {}
+    for conditional in (False, True):
+        results[conditional] = simulate(feeds, conditional)
+        requests, not_modified, sent, cpu = results[conditional]
+        print "%-16s requests=%d 304s=%d bytes=%d cpu=%.2fs (%.2fms/request)" % (
+            conditional and "conditional" or "unconditional",
+            requests, not_modified, sent, cpu, cpu * 1000 / requests)
+    plain, cond = results[False], results[True]
+    print "bandwidth saved: %.1f%%, cpu saved: %.1f%%" % (
+        100.0 * (plain[2] - cond[2]) / plain[2], 100.0 * (plain[3] - cond[3]) / plain[3])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Bytes sent to a reader population with and without delta feeds.
+
+    python -m bench.delta [readers per feed] [rounds] [overlap seconds]
+
+Readers poll the RSS and Atom feeds of a few busy feeds every round with
+conditional GET; between rounds some feeds receive new mail. The same
+population runs twice: once fetching whole feeds and once sending
+"A-IM: feed" (RFC 3229) to get only the new entries. Reports requests,
+226/200/304 responses and bytes sent. With the default DELTA_OVERLAP every
+message stored during the run is inside the overlap window, so pass a
+small overlap to see what readers polling hours apart would get.
+"""
+import datetime, random, sys
+from bench import gae
+
+FEEDS = 10
+MESSAGES = 50
+CHANGED_PER_ROUND = 3
+
+def deliver(feed_names, round):
+    import config
+    from util import Ingest
+    for name in random.sample(feed_names, CHANGED_PER_ROUND):
+        Ingest.store([{'recipients': [name + config.SETTINGS['emaildomain']], 'sender': 'list@example.org',
+                       'subject': 'Round %d' % round, 'body': gae.sample_body(20000),
+                       'messageId': '<%s-%d@bench>' % (name, round), 'dateSent': None,
+                       'dateReceived': datetime.datetime.now()}])
+
+def simulate(feed_names, feeds, readers, rounds, delta):
+    random.seed(1)
+    validators = {}
+    counts = {200: 0, 226: 0, 304: 0}
+    sent = 0
+    for round in range(rounds):
+        for feed_url in feeds:
+            for reader in range(readers):
+                for prefix in ("/rss/", "/"):
+                    path = prefix + feed_url
+                    headers = {}
+                    if (path, reader) in validators:
+                        headers['If-None-Match'] = validators[path, reader]
+                        if delta:
+                            headers['A-IM'] = 'feed'
+                    status, response_headers, body = gae.request(path, headers)
+                    counts[status] = counts.get(status, 0) + 1
+                    sent += len(body)
+                    if status != 304:
+                        validators[path, reader] = response_headers.get('ETag')
+        deliver(feed_names, round)
+    return counts, sent
+
+def main():
+    readers = len(sys.argv) > 1 and int(sys.argv[1]) or 10
+    rounds = len(sys.argv) > 2 and int(sys.argv[2]) or 10
+    gae.setup()
+    import config
+    if len(sys.argv) > 3:
+        config.SETTINGS['delta_overlap'] = int(sys.argv[3])
+    results = {}
+    for delta in (False, True):
+        feed_names = ["delta%d%02d" % (delta, i) for i in range(FEEDS)]
+        feeds = [gae.seed_feed(name, MESSAGES) for name in feed_names]
+        results[delta] = simulate(feed_names, feeds, readers, rounds, delta)
+    for delta in (False, True):
+        counts, sent = results[delta]
+        print "%-12s %5d requests  200: %5d  226: %5d  304: %5d  %8.1f MB sent" % (
+            delta and "A-IM: feed" or "whole feeds", sum(counts.values()), counts[200], counts[226], counts[304],
+            sent / 1048576.0)
+    print "delta feeds sent %.0f%% fewer bytes" % ((1 - float(results[True][1]) / results[False][1]) * 100)
+
+if __name__ == "__main__":
+    main()
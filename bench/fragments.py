@@ -0,0 +1,48 @@
+"""Feed request latency with and without fragments pre-rendered at ingest.
+
+The rendered-feed cache is cleared before every request so each one
+builds the document from the stored messages.
+"""
+import time
+from bench import gae
+
+MESSAGES = 50
+REQUESTS = 20
+
+def measure(feed_url):
+    from util import FeedCache
+    results = {}
+    for prefix in ("/rss/", "/"):
+        timings = []
+        for i in range(REQUESTS):
+            FeedCache._cache.clear()
+            start = time.time()
+            status, headers, body = gae.request(prefix + feed_url)
+            timings.append(time.time() - start)
+        timings.sort()
+        results[prefix] = (timings[len(timings) / 2], body)
+    return results
+
+def main():
+    gae.setup()
+    from models.models import MailMessage
+    from util import Fragments
+    from controllers.Tasks import save
+    feed_url = gae.seed_feed("fragments", MESSAGES)
+
+    before = measure(feed_url)
+    messages = MailMessage.all().fetch(MESSAGES)
+    MailMessage.load_content(messages)
+    for message in messages:
+        Fragments.render(message, feed_url)
+    save(messages)
+    after = measure(feed_url)
+
+    for prefix, name in (("/rss/", "rss"), ("/", "atom")):
+        print "%-5s median %.1f ms before, %.1f ms after (%d messages)" % (
+            name, before[prefix][0] * 1000, after[prefix][0] * 1000, MESSAGES)
+        if name == "atom" and before[prefix][1] != after[prefix][1]:
+            print "      warning: atom output changed"
+
+if __name__ == "__main__":
+    main()
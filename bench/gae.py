@@ -0,0 +1,135 @@
+"""Runs the app in-process against the SDK's local service stubs.
+
+Benchmarks are run from the application root, e.g.
+
+    python -m bench.conditional_get
+
+Set APPENGINE_SDK to the App Engine SDK directory if it isn't installed in
+/usr/local/google_appengine.
+"""
+import os, sys, datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SDK_DIR = os.environ.get('APPENGINE_SDK', '/usr/local/google_appengine')
+APP_ID = 'email2feed-bench'
+HOST = 'localhost:8080'
+
+def setup():
+    sys.path[0:0] = [ROOT_DIR, SDK_DIR]
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    os.chdir(ROOT_DIR) #templates are rendered relative to the app root
+
+    os.environ['APPLICATION_ID'] = APP_ID
+    os.environ['SERVER_NAME'] = 'localhost'
+    os.environ['SERVER_PORT'] = '8080'
+    os.environ['HTTP_HOST'] = HOST
+    os.environ['AUTH_DOMAIN'] = 'gmail.com'
+    os.environ['USER_EMAIL'] = ''
+
+    from google.appengine.api import apiproxy_stub_map, datastore_file_stub, user_service_stub
+    from google.appengine.api.memcache import memcache_stub
+    apiproxy_stub_map.apiproxy = apiproxy_stub_map.APIProxyStubMap()
+    apiproxy_stub_map.apiproxy.RegisterStub('datastore_v3',
+        datastore_file_stub.DatastoreFileStub(APP_ID, None, None)) #no files, in memory only
+    apiproxy_stub_map.apiproxy.RegisterStub('memcache', memcache_stub.MemcacheServiceStub())
+    apiproxy_stub_map.apiproxy.RegisterStub('user', user_service_stub.UserServiceStub())
+    from google.appengine.api import urlfetch_stub
+    apiproxy_stub_map.apiproxy.RegisterStub('urlfetch', urlfetch_stub.URLFetchServiceStub()) #real HTTP
+    try:
+        from google.appengine.api.taskqueue import taskqueue_stub
+    except ImportError:
+        from google.appengine.api.labs.taskqueue import taskqueue_stub
+    apiproxy_stub_map.apiproxy.RegisterStub('taskqueue',
+        taskqueue_stub.TaskQueueServiceStub(root_path=ROOT_DIR)) #reads queue.yaml, never runs tasks
+
+def request(path, headers=None, method='GET', body=''):
+    """Drives main.application like the SDK's WSGI server would.
+
+    Returns (status code, response headers, body).
+    """
+    import main, StringIO
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path.split('?')[0],
+        'QUERY_STRING': '?' in path and path.split('?', 1)[1] or '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '8080',
+        'HTTP_HOST': HOST,
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': StringIO.StringIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.version': (1, 0),
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in (headers or {}).items():
+        if name.lower() == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        else:
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+    response = {}
+    def start_response(status, response_headers, exc_info=None):
+        response['status'] = int(status.split()[0])
+        response['headers'] = dict(response_headers)
+    output = ''.join(main.application(environ, start_response))
+    return response['status'], response['headers'], output
+
+def run_tasks(queue_name):
+    """Runs the push tasks queued so far, once each, in order.
+
+    Returns (url, status code, body) of every task run. A failed task is
+    dropped rather than retried; callers rerun it if they want to.
+    """
+    import base64
+    from google.appengine.api import apiproxy_stub_map
+    stub = apiproxy_stub_map.apiproxy.GetStub('taskqueue')
+    statuses = []
+    for task in stub.GetTasks(queue_name):
+        stub.DeleteTask(queue_name, task['name'])
+        body = base64.b64decode(task.get('body') or '')
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        status, response_headers, output = request(task['url'], headers, task['method'], body)
+        statuses.append((task['url'], status, body))
+    return statuses
+
+def seed_feed(email_name, messages, body_size=20000, inline=False):
+    """Creates an account with a number of newsletter sized messages.
+
+    With inline set the bodies are stored the way they were before MailBody.
+    Returns the feed url.
+    """
+    from google.appengine.ext import db
+    from models.models import UserDetails, MailMessage
+    import config
+    feed_url = email_name + "-bench"
+    user = UserDetails()
+    user.emailName = email_name
+    user.feedUrl = feed_url
+    user.put()
+
+    body = sample_body(body_size)
+    now = datetime.datetime.now()
+    for i in range(messages):
+        message = MailMessage()
+        message.toAddress = email_name + config.SETTINGS['emaildomain']
+        message.fromAddress = "newsletter@example.com"
+        message.subject = "Issue %d" % i
+        message.dateSent = now.strftime("%a, %d %b %Y %H:%M:%S +0000")
+        message.dateReceived = now - datetime.timedelta(minutes=messages - i)
+        message.size = len(body)
+        if inline:
+            message.inlineBody = body
+            message.put()
+        else:
+            message.put()
+            message.body = body
+            db.put(message.content())
+    return feed_url
+
+def sample_body(size):
+    paragraph = "<p style='font-family: Arial'>Lorem ipsum dolor sit amet, <a href='http://example.com/?a=1&b=2'>consectetur</a> adipiscing elit &amp; more.</p>\n"
+    return (paragraph * (size / len(paragraph) + 1))[:size]
@@ -0,0 +1,91 @@
+"""Replays mail through the inbound mail handler at a fixed rate.
+
+    python -m bench.ingest_load [mbox] [messages/second] [seconds]
+
+Without an mbox, synthetic newsletters are sent. Every message is posted to
+/_ah/mail/ like the mail service does; the ingest worker is run every
+INGEST_BATCH_DELAY seconds, as the task queue would. Reports the sustained
+rate and the latency from arrival until the message is stored.
+"""
+import mailbox, random, sys, time
+from email.mime.text import MIMEText
+from bench import gae
+
+ACCOUNTS = 20
+
+def synthetic_messages(count):
+    for i in range(count):
+        message = MIMEText(gae.sample_body(20000), 'html')
+        message['From'] = 'List <list%d@example.com>' % (i % 7)
+        message['Subject'] = 'Digest %d' % i
+        message['Date'] = 'Mon, 01 Nov 2010 12:00:00 +0000'
+        yield message
+
+def mbox_messages(path):
+    for message in mailbox.mbox(path):
+        yield message
+
+def main():
+    path = len(sys.argv) > 1 and sys.argv[1] or None
+    rate = len(sys.argv) > 2 and float(sys.argv[2]) or 20.0
+    duration = len(sys.argv) > 3 and float(sys.argv[3]) or 10.0
+    gae.setup()
+    import config
+    from models.models import MailMessage
+    names = ["load%02d" % i for i in range(ACCOUNTS)]
+    for name in names:
+        gae.seed_feed(name, 0)
+
+    total = int(rate * duration)
+    if path:
+        source = mbox_messages(path)
+    else:
+        source = synthetic_messages(total)
+
+    random.seed(1)
+    sent = []
+    latencies = []
+    drain_every = config.SETTINGS['ingest_batch_delay']
+    start = next_drain = time.time()
+    for i, message in enumerate(source):
+        if i >= total:
+            break
+        address = random.choice(names) + config.SETTINGS['emaildomain']
+        del message['To']
+        message['To'] = address
+        while time.time() < start + i / rate:
+            time.sleep(0.001)
+        sent.append(time.time())
+        gae.request('/_ah/mail/' + address, method='POST', body=message.as_string())
+        if time.time() >= next_drain:
+            drain(sent, latencies)
+            next_drain = time.time() + drain_every
+    while len(latencies) < len(sent):
+        if not drain(sent, latencies):
+            break
+    elapsed = time.time() - start
+
+    latencies.sort()
+    stored = MailMessage.all().count()
+    print "%d messages sent, %d stored in %.1fs: %.1f messages/s sustained" % (
+        len(sent), stored, elapsed, stored / elapsed)
+    if latencies:
+        print "ingest latency p50 %.0f ms, p99 %.0f ms" % (
+            latencies[len(latencies) / 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000)
+
+def drain(sent, latencies):
+    """Runs the worker once. Leased tasks come back oldest first, so the
+    messages still queued are the most recently sent ones."""
+    from google.appengine.api import apiproxy_stub_map
+    from util import Ingest
+    gae.request('/tasks/ingest', method='POST')
+    done = time.time()
+    queued = len(apiproxy_stub_map.apiproxy.GetStub('taskqueue').GetTasks(Ingest.QUEUE))
+    stored = 0
+    for i in range(len(latencies), len(sent) - queued):
+        latencies.append(done - sent[i])
+        stored += 1
+    return stored
+
+if __name__ == "__main__":
+    main()
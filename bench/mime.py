@@ -0,0 +1,101 @@
+"""Body extraction cost, the old bodies() walk vs util/MimeBody.extract.
+
+Builds a corpus shaped like real inbound mail (plain/html alternatives,
+newsletters with inline images, large PDF attachments, non-utf8 charsets,
+oversized bodies) and reports CPU time and the peak resident memory of a
+child process extracting each sample.
+"""
+import os, resource, time
+from email.mime.application import MIMEApplication
+from email.mime.image import MIMEImage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from bench import gae
+
+REPEAT = 20
+
+def newsletter(size):
+    return gae.sample_body(size)
+
+def corpus():
+    samples = []
+    samples.append(("plain text", MIMEText("Hello,\n\nJust a short note.\n" * 40)))
+
+    alternative = MIMEMultipart('alternative')
+    alternative.attach(MIMEText("plain version " * 2000))
+    alternative.attach(MIMEText(newsletter(60000), 'html', 'utf-8'))
+    samples.append(("alternative", alternative))
+
+    related = MIMEMultipart('related')
+    related.attach(MIMEText(newsletter(80000), 'html'))
+    for i in range(8):
+        related.attach(MIMEImage(os.urandom(150000), 'png'))
+    samples.append(("inline images", related))
+
+    mixed = MIMEMultipart('mixed')
+    mixed.attach(MIMEText(newsletter(20000), 'html'))
+    pdf = MIMEApplication(os.urandom(5 * 1024 * 1024), 'pdf')
+    pdf.add_header('Content-Disposition', 'attachment', filename='report.pdf')
+    mixed.attach(pdf)
+    samples.append(("pdf attachment", mixed))
+
+    latin = MIMEText(u"Caf\xe9 cr\xe8me br\xfbl\xe9e. " * 4000, 'plain', 'iso-8859-1')
+    samples.append(("iso-8859-1", latin))
+
+    huge = MIMEText(newsletter(4 * 1024 * 1024), 'html', 'utf-8')
+    samples.append(("4MB html body", huge))
+    return [(name, message.as_string()) for name, message in samples]
+
+def legacy_body(message):
+    """_getBody as it was before util/MimeBody.py"""
+    from google.appengine.api.mail import EncodedPayload
+    ret = None
+    for contentType, body in message.bodies():
+        if (contentType == 'text/html'):
+            ret = body
+            break
+        if (contentType == 'text/plain'):
+            ret = body
+    if isinstance(ret, EncodedPayload):
+        if ret.encoding == '8bit':
+            ret.encoding = '7bit'
+        ret = ret.decode()
+    return ret
+
+def new_body(message):
+    import config
+    from util import MimeBody
+    return MimeBody.extract(message.original, config.SETTINGS['max_body_size'])
+
+def measure(raw, extract):
+    """CPU seconds per extraction and extra peak RSS, in a child process"""
+    from google.appengine.api import mail
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        messages = [mail.InboundEmailMessage(raw) for i in range(REPEAT)]
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.clock()
+        for message in messages:
+            extract(message)
+        elapsed = (time.clock() - start) / REPEAT
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+        os.write(write, "%f %d" % (elapsed, peak))
+        os._exit(0)
+    os.close(write)
+    result = os.read(read, 100)
+    os.waitpid(pid, 0)
+    elapsed, peak = result.split()
+    return float(elapsed), int(peak)
+
+def main():
+    gae.setup() #for the SDK's mail module and config.py
+    for name, raw in corpus():
+        old_cpu, old_peak = measure(raw, legacy_body)
+        new_cpu, new_peak = measure(raw, new_body)
+        print "%-15s %6d KB  bodies() %7.2f ms +%6d KB   MimeBody %7.2f ms +%6d KB" % (
+            name, len(raw) / 1024, old_cpu * 1000, old_peak, new_cpu * 1000, new_peak)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Indexing throughput and query latency of the search index.
+
+    python -m bench.search [messages] [queries]
+
+Indexes a synthetic corpus into one feed, in ingest sized batches, with
+subjects and bodies drawn from a Zipf distributed vocabulary (so a few
+terms are in most messages and most terms in few), then runs one, two
+and three term queries of common, middling and rare terms before and
+after the posting segments are merged.
+"""
+import bisect, random, sys, time
+from bench import gae
+
+VOCABULARY = 20000
+BATCH = 50 #messages per ingest batch, one posting segment per term each
+SUBJECT_WORDS = 8
+BODY_WORDS = 300
+
+def zipf(size, s=1.1):
+    total = 0.0
+    cumulative = []
+    for rank in range(1, size + 1):
+        total += 1.0 / rank ** s
+        cumulative.append(total)
+    return [value / total for value in cumulative]
+
+def words(cumulative, count):
+    return " ".join(["w%d" % bisect.bisect(cumulative, random.random()) for i in range(count)])
+
+def index(feed_url, messages):
+    from google.appengine.ext import db
+    from models.models import MailMessage
+    from util import FeedStats, Search
+    import config
+    cumulative = zipf(VOCABULARY)
+    elapsed = 0.0
+    for start in range(0, messages, BATCH):
+        batch = []
+        for i in range(start, min(start + BATCH, messages)):
+            message = MailMessage()
+            message.toAddress = feed_url + config.SETTINGS['emaildomain']
+            message.fromAddress = "sender%d@example.com" % random.randint(0, 200)
+            message.subject = words(cumulative, SUBJECT_WORDS)
+            message.size = 0
+            batch.append(message)
+        db.put(batch)
+        for message in batch:
+            message.body = "<p>%s</p>" % words(cumulative, BODY_WORDS)
+        started = time.time()
+        Search.index([(feed_url, message) for message in batch])
+        elapsed += time.time() - started
+    FeedStats.add(feed_url, messages, 0, None, None)
+    return elapsed
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def query(feed_url, queries):
+    from util import Search
+    ranks = (("common", 1, 20), ("middling", 100, 1000), ("rare", 5000, VOCABULARY))
+    for name, low, high in ranks:
+        for count in (1, 2, 3):
+            timings = []
+            matched = 0
+            for i in range(queries):
+                text = " ".join(["w%d" % random.randint(low, high) for j in range(count)])
+                started = time.time()
+                total, ids = Search.search(feed_url, text)
+                timings.append(time.time() - started)
+                matched += total
+            print "  %-8s %d term%s  p50 %7.2f ms  p90 %7.2f ms  %8.1f matches" % (
+                name, count, count > 1 and "s" or " ", percentile(timings, 0.5) * 1000,
+                percentile(timings, 0.9) * 1000, float(matched) / queries)
+
+def main():
+    messages = len(sys.argv) > 1 and int(sys.argv[1]) or 100000
+    queries = len(sys.argv) > 2 and int(sys.argv[2]) or 50
+    gae.setup()
+    from models.models import SearchPostings
+    from util import Search
+    random.seed(1)
+    feed_url = "search-bench"
+    elapsed = index(feed_url, messages)
+    print "indexed %d messages in %.1f s: %.0f messages/s, %d segments" % (
+        messages, elapsed, messages / elapsed, Search.stats['segments'])
+
+    print "before merging"
+    query(feed_url, queries)
+    Search.schedule_merge = lambda term_key: None #merged all at once below
+    terms = set([segment.term for segment in SearchPostings.all()])
+    started = time.time()
+    for term in terms:
+        Search.merge(term)
+    print "merged %d terms in %.1f s" % (len(terms), time.time() - started)
+    print "after merging"
+    query(feed_url, queries)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Compares RSS2.to_xml with the streaming RSS2.iter_xml serializer.
+
+Checks the output is byte-identical, then reports throughput and the peak
+resident memory of a child process rendering each synthetic feed.
+"""
+import datetime, os, resource, sys, time
+from libs import PyRSS2Gen
+
+SIZES = (50, 500, 5000)
+BODY_SIZE = 20000
+REPEAT = 3
+
+def build_feed(items):
+    paragraph = u"<p style='color:#333'>Caf\xe9 news &amp; <a href=\"http://example.com/?a=1&b=2\">links</a> — more.</p>\n"
+    body = (paragraph * (BODY_SIZE / len(paragraph) + 1))[:BODY_SIZE]
+    now = datetime.datetime(2010, 11, 1, 12, 0, 0)
+    rss_items = []
+    for i in range(items):
+        link = "http://example.appspot.com/view/bench-feed/%d" % i
+        rss_items.append(PyRSS2Gen.RSSItem(title="Issue <%d> & co" % i, description=body,
+                                           pubDate=now - datetime.timedelta(minutes=i),
+                                           guid=PyRSS2Gen.Guid(link), link=link))
+    return PyRSS2Gen.RSS2(title="bench - email2feed", link="http://localhost/rss/bench-feed",
+                          description="bench@example.appspotmail.com",
+                          lastBuildDate=now, items=rss_items)
+
+def render_to_xml(rss):
+    return len(rss.to_xml())
+
+def render_iter_xml(rss):
+    sent = 0
+    for chunk in rss.iter_xml():
+        sent += len(chunk) #stands in for response.out.write
+    return sent
+
+def measure(items, render):
+    """Runs in a child so ru_maxrss is the peak for this case alone"""
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        rss = build_feed(items)
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        for i in range(REPEAT):
+            size = render(rss)
+        elapsed = (time.time() - start) / REPEAT
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+        os.write(write, "%d %f %d" % (size, elapsed, peak))
+        os._exit(0)
+    os.close(write)
+    result = os.read(read, 100)
+    os.waitpid(pid, 0)
+    size, elapsed, peak = result.split()
+    return int(size), float(elapsed), int(peak)
+
+def main():
+    rss = build_feed(50)
+    if rss.to_xml() != "".join(rss.iter_xml()):
+        sys.exit("iter_xml output differs from to_xml")
+    print "output is byte-identical"
+    for items in SIZES:
+        for name, render in (("to_xml", render_to_xml), ("iter_xml", render_iter_xml)):
+            size, elapsed, peak = measure(items, render)
+            print "%5d items %-9s %8.1f ms %7.1f MB/s  peak +%d KB" % (
+                items, name, elapsed * 1000, size / elapsed / 1048576, peak)
+
+if __name__ == "__main__":
+    main()
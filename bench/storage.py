@@ -0,0 +1,45 @@
+"""Datastore bytes read per request, bodies stored inline vs in MailBody.
+
+Counts the size of every datastore_v3 response while serving the web view
+and both feeds (with the rendered-feed cache cleared), before and after
+running the body migration over the same messages.
+"""
+from bench import gae
+
+MESSAGES = 50
+PATHS = (("web view", "/view/"), ("rss", "/rss/"), ("atom", "/"))
+
+read = {'bytes': 0, 'calls': 0}
+
+def count_response(service, call, request, response):
+    read['bytes'] += response.ByteSize()
+    read['calls'] += 1
+
+def measure(feed_url):
+    from util import FeedCache
+    results = {}
+    for name, prefix in PATHS:
+        FeedCache._cache.clear()
+        read['bytes'] = read['calls'] = 0
+        gae.request(prefix + feed_url)
+        results[name] = (read['bytes'], read['calls'])
+    return results
+
+def main():
+    gae.setup()
+    from google.appengine.api import apiproxy_stub_map
+    apiproxy_stub_map.apiproxy.GetPostCallHooks().Append('bench-bytes', count_response, 'datastore_v3')
+    from models.models import MailMessage
+    from controllers.Tasks import MigrateBodies
+    feed_url = gae.seed_feed("storage", MESSAGES, inline=True)
+
+    before = measure(feed_url)
+    MigrateBodies().process(MailMessage.all().fetch(MESSAGES))
+    after = measure(feed_url)
+
+    for name, prefix in PATHS:
+        print "%-8s inline %8d bytes in %d calls, MailBody %8d bytes in %d calls" % (
+            name, before[name][0], before[name][1], after[name][0], after[name][1])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Scripted workloads over the whole request path, for catching regressions.
+
+    python -m bench.suite [--users N] [--messages M] [--requests R]
+                          [--save results.json] [--baseline results.json]
+
+Seeds N accounts with M messages each in the SDK's in-memory datastore,
+then drives main.application (see bench/gae.py) with each workload:
+
+  poll      feed readers fetching /rss/<feed> and /<feed>, half of them
+            sending back the validators from their last fetch
+  browse    the web view, its older pages and single messages
+  register  new account registrations
+  ingest    mail posted to /_ah/mail/ with the ingest worker run every
+            50 messages, as the task queue would
+
+For each it reports requests/s, latency percentiles, net new GC-tracked
+objects per request (gc is paused while a workload runs) and the process's
+peak RSS. With --baseline it exits non-zero when a workload's p50 is more
+than --tolerance slower than the saved run.
+"""
+import gc, optparse, os, random, resource, sys, time
+from email.mime.text import MIMEText
+try:
+    import json
+except ImportError:
+    from django.utils import simplejson as json
+from bench import gae
+
+def poll(feeds, requests):
+    validators = {}
+    for i in range(requests):
+        path = random.choice(("/rss/", "/")) + random.choice(feeds)
+        headers = {}
+        if i % 2 and path in validators:
+            headers['If-None-Match'] = validators[path]
+        start = time.time()
+        status, response_headers, body = gae.request(path, headers)
+        yield time.time() - start
+        if 'ETag' in response_headers:
+            validators[path] = response_headers['ETag']
+
+def browse(feeds, requests):
+    from models.models import MailMessage
+    ids = [key.id() for key in MailMessage.all(keys_only=True).fetch(200)]
+    for i in range(requests):
+        feed_url = random.choice(feeds)
+        path = random.choice(("/view/%s" % feed_url,
+                              "/view/%s?before=%d" % (feed_url, (time.time() - 600) * 1000000),
+                              "/view/%s/%d" % (feed_url, random.choice(ids))))
+        start = time.time()
+        gae.request(path)
+        yield time.time() - start
+
+def register(feeds, requests):
+    os.environ['USER_EMAIL'] = 'owner@example.com' #logged in, so each feed gets an owner
+    try:
+        for i in range(requests):
+            body = "email_name=suite%05d" % i
+            start = time.time()
+            gae.request('/register', {'Content-Type': 'application/x-www-form-urlencoded'}, 'POST', body)
+            yield time.time() - start
+    finally:
+        os.environ['USER_EMAIL'] = ''
+
+def ingest(feeds, requests):
+    import config
+    from models.models import UserDetails
+    names = [user.emailName for user in UserDetails.all().fetch(1000) if user.feedUrl in feeds]
+    message = MIMEText(gae.sample_body(20000), 'html')
+    message['From'] = 'List <list@example.com>'
+    message['Subject'] = 'Digest'
+    message['Date'] = 'Mon, 01 Nov 2010 12:00:00 +0000'
+    for i in range(requests):
+        address = random.choice(names) + config.SETTINGS['emaildomain']
+        del message['To']
+        message['To'] = address
+        start = time.time()
+        gae.request('/_ah/mail/' + address, method='POST', body=message.as_string())
+        if i % 50 == 49:
+            gae.request('/tasks/ingest', method='POST')
+        yield time.time() - start
+
+WORKLOADS = (("poll", poll), ("browse", browse), ("register", register), ("ingest", ingest))
+
+def run(name, workload, feeds, requests):
+    random.seed(name)
+    gc.collect()
+    gc.disable()
+    before = gc.get_count()[0]
+    start = time.time()
+    latencies = list(workload(feeds, requests))
+    elapsed = time.time() - start
+    objects = gc.get_count()[0] - before
+    gc.enable()
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+    return {
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': percentile(0.5),
+        'p90_ms': percentile(0.9),
+        'p99_ms': percentile(0.99),
+        'objects_per_request': float(objects) / len(latencies),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--users", type="int", default=20)
+    parser.add_option("--messages", type="int", default=50)
+    parser.add_option("--requests", type="int", default=200)
+    parser.add_option("--only", help="comma separated workloads to run")
+    parser.add_option("--save", help="write the results to this file")
+    parser.add_option("--baseline", help="compare with results saved earlier")
+    parser.add_option("--tolerance", type="float", default=0.2, help="allowed p50 slowdown (0.2 = 20%)")
+    options, args = parser.parse_args()
+
+    gae.setup()
+    import config
+    config.SETTINGS['instrument_sample_rate'] = 0 #measure the app, not the instrumentation
+    feeds = [gae.seed_feed("suite%03d" % i, options.messages) for i in range(options.users)]
+
+    results = {}
+    for name, workload in WORKLOADS:
+        if options.only and name not in options.only.split(","):
+            continue
+        results[name] = result = run(name, workload, feeds, options.requests)
+        print "%-9s %7.1f req/s  p50 %6.1f ms  p90 %6.1f ms  p99 %6.1f ms  %7.0f objects/req  peak rss %d KB" % (
+            name, result['requests_per_second'], result['p50_ms'], result['p90_ms'], result['p99_ms'],
+            result['objects_per_request'], result['peak_rss_kb'])
+
+    if options.save:
+        open(options.save, "w").write(json.dumps(results, indent=2))
+    if options.baseline:
+        baseline = json.loads(open(options.baseline).read())
+        regressed = [name for name in results if name in baseline and
+                     results[name]['p50_ms'] > baseline[name]['p50_ms'] * (1 + options.tolerance)]
+        for name in regressed:
+            print "REGRESSION %s: p50 %.1f ms, baseline %.1f ms" % (
+                name, results[name]['p50_ms'], baseline[name]['p50_ms'])
+        if regressed:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Feed payload in summary mode against whole bodies, for newsletter traffic.
+
+    python -m bench.summary [messages]
+
+Stores [messages] newsletters (bodies of 5 to 80 KB, most around 20 KB,
+like the sample traffic in bench/gae.py) through Ingest.store, so each
+gets its excerpt at ingest, then fetches the RSS and Atom feeds whole and
+with ?mode=summary, plain and gzipped. Reports bytes per feed, the
+reduction, and the datastore calls and time of rendering each uncached.
+"""
+import datetime, random, sys, time
+from bench import gae
+
+SIZES = (5000, 10000, 20000, 20000, 20000, 40000, 80000)
+
+calls = {'datastore_v3': 0}
+
+def count(service, call, request, response):
+    calls[service] = calls.get(service, 0) + 1
+
+def measure(path, headers=None):
+    from util import FeedCache
+    FeedCache._cache.clear() #render every time
+    calls['datastore_v3'] = 0
+    started = time.time()
+    status, response_headers, body = gae.request(path, headers)
+    assert status == 200, status
+    return len(body), calls['datastore_v3'], time.time() - started
+
+def main():
+    messages = len(sys.argv) > 1 and int(sys.argv[1]) or 50
+    gae.setup()
+    from google.appengine.api import apiproxy_stub_map
+    import config
+    from util import Ingest
+    apiproxy_stub_map.apiproxy.GetPostCallHooks().Append('bench', count)
+    random.seed(1)
+    feed_url = gae.seed_feed("summary", 0)
+    for i in range(messages):
+        Ingest.store([{'recipients': ['summary' + config.SETTINGS['emaildomain']], 'sender': 'list@example.org',
+                       'subject': 'Issue %d' % i, 'body': gae.sample_body(random.choice(SIZES)),
+                       'messageId': '<%d@summary-bench>' % i, 'dateSent': None,
+                       'dateReceived': datetime.datetime.now()}])
+    for prefix in ("/rss/", "/"):
+        for encoding in ("", "gzip"):
+            headers = encoding and {'Accept-Encoding': encoding} or {}
+            full, full_calls, full_time = measure(prefix + feed_url + "?mode=full", headers)
+            short, short_calls, short_time = measure(prefix + feed_url + "?mode=summary", headers)
+            print "%-6s %-5s full %8.1f KB %3d calls %6.1f ms   summary %8.1f KB %3d calls %6.1f ms   %.0f%% smaller" % (
+                prefix, encoding or "plain", full / 1024.0, full_calls, full_time * 1000,
+                short / 1024.0, short_calls, short_time * 1000, (1 - float(short) / full) * 100)
+
+if __name__ == "__main__":
+    main()
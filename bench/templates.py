@@ -0,0 +1,83 @@
+"""Page render time: template.render with the per-request App.data it
+replaced, vs util/Templates with the precomputed base data.
+
+    python -m bench.templates
+
+Renders index.html, web.html (one page of messages) and the Atom feed
+(atom-head.xml plus one atom-entry.xml per message) for a logged-in user.
+"""
+import os, time
+from bench import gae
+
+REPEAT = 200
+
+def legacy_data(view_data):
+    """App.data as it was before the base data was precomputed"""
+    import config
+    from google.appengine.api import users
+    from models.models import UserDetails
+    view_data['logged_in'] = False
+    view_data['base_title'] = config.SETTINGS['platform']
+    view_data['hostname'] = config.SETTINGS['hostname']
+    view_data['emaildomain'] = config.SETTINGS['emaildomain']
+    user = users.get_current_user()
+    if user:
+        view_data['logged_in'] = True
+        view_data['auth_link'] = users.create_logout_url("/")
+        for current_user in UserDetails.gql("WHERE accountName = :1 LIMIT 1", user):
+            view_data['account_name'] = current_user.emailName
+    else:
+        view_data['auth_link'] = users.create_login_url("/")
+    if view_data.get('user_get'):
+        view_data['rss_link'] = '<link rel="alternate" type="application/rss+xml" title="' + view_data['user_get'] + ' feed at email2feed" href="/rss/' + view_data['user_get'] + '">'
+        view_data['atom_link'] = '<link rel="alternate"  type="application/atom+xml"  title="' + view_data['user_get'] + ' feed at email2feed" href="/' + view_data['user_get'] + '">'
+    view_data['errors'] = []
+    return view_data
+
+def legacy_render(name, view_data):
+    from google.appengine.ext.webapp import template
+    return template.render(os.path.join(gae.ROOT_DIR, 'views', name), legacy_data(view_data))
+
+def new_render(name, view_data):
+    from controllers.Base import App
+    from util import Templates
+    return Templates.render(name, App().data(view_data))
+
+def pages(feed_url, messages):
+    from util import Fragments
+    page = {'emails': messages, 'feed_url': feed_url, 'feed_path': feed_url, 'user_get': feed_url}
+    head = {'feedTitle': 'bench', 'feedUrl': feed_url, 'updated': '', 'name': 'bench', 'email': 'bench'}
+    entry = lambda message: {'result': message, 'userlink': Fragments.user_link(feed_url),
+                             'feedFooter': Fragments.atom_footer(feed_url)}
+    return [
+        ("index.html", [("index.html", lambda: {})]),
+        ("web.html", [("view/web.html", lambda: dict(page))]),
+        ("atom.xml", [("view/atom-head.xml", lambda: dict(head))] +
+                     [("view/atom-entry.xml", lambda message=message: entry(message)) for message in messages]),
+    ]
+
+def measure(render, templates):
+    from util import Accounts
+    start = time.time()
+    for i in range(REPEAT):
+        Accounts.start_request()
+        for name, view_data in templates:
+            render(name, view_data())
+    return (time.time() - start) / REPEAT
+
+def main():
+    gae.setup()
+    os.environ['USER_EMAIL'] = 'reader@example.com'
+    import config
+    from models.models import MailMessage
+    feed_url = gae.seed_feed("templates", config.SETTINGS['pagesize'])
+    messages = MailMessage.all().order("-dateReceived").fetch(config.SETTINGS['pagesize'])
+    MailMessage.load_content(messages)
+    for page, templates in pages(feed_url, messages):
+        old = measure(legacy_render, templates)
+        new = measure(new_render, templates)
+        print "%-10s template.render %7.2f ms   Templates.render %7.2f ms  (%.0f%% less)" % (
+            page, old * 1000, new * 1000, (1 - new / old) * 100)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""WebSub delivery against local subscribers, and the polling it replaces.
+
+    python -m bench.websub [subscribers] [messages] [poll minutes]
+
+Starts HTTP subscriber stand-ins on localhost (one of them fails its first
+two deliveries), subscribes each to a feed through /hub, then stores mail
+and runs the hub's tasks as the queue would, rerunning failed deliveries.
+Reports deliveries, retries and signature checks, and compares the
+requests these readers would have made polling every [poll minutes] over
+the same period with the pushes that replaced them.
+"""
+import BaseHTTPServer, cgi, datetime, hashlib, hmac, sys, threading, time, urlparse
+from bench import gae
+
+SECRET = "bench-secret"
+HOURS = 24 #period the messages are spread over
+
+class Subscriber(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self): #intent verification: echo the challenge
+        query = cgi.parse_qs(urlparse.urlparse(self.path)[4])
+        self.server.verified += 1
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(query['hub.challenge'][0])
+
+    def do_POST(self): #content distribution
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.server.fail > 0:
+            self.server.fail -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+        expected = "sha1=" + hmac.new(SECRET, body, hashlib.sha1).hexdigest()
+        self.server.signed += self.headers.get('X-Hub-Signature') == expected
+        self.server.received += 1
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+def start_subscriber(fail=0):
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Subscriber)
+    server.verified = server.received = server.signed = 0
+    server.fail = fail
+    thread = threading.Thread(target=server.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+    return server
+
+def run_hub_tasks():
+    """Runs the hub queue until it is empty, rerunning failed tasks like the queue's retries"""
+    from util import Hub
+    try:
+        from google.appengine.api import taskqueue
+    except ImportError:
+        from google.appengine.api.labs import taskqueue
+    runs = failures = 0
+    while True:
+        results = gae.run_tasks(Hub.QUEUE)
+        if not results:
+            return runs, failures
+        for url, status, body in results:
+            runs += 1
+            if status >= 500:
+                failures += 1
+                params = dict(cgi.parse_qsl(body))
+                taskqueue.Queue(Hub.QUEUE).add(taskqueue.Task(url=url, params=params))
+
+def main():
+    subscribers = len(sys.argv) > 1 and int(sys.argv[1]) or 5
+    messages = len(sys.argv) > 2 and int(sys.argv[2]) or 20
+    poll_minutes = len(sys.argv) > 3 and int(sys.argv[3]) or 30
+    gae.setup()
+    from util import Hub, Ingest
+    import config
+    feed_url = gae.seed_feed("websub", 5)
+
+    servers = [start_subscriber(fail=i == 0 and 2 or 0) for i in range(subscribers)]
+    for i, server in enumerate(servers):
+        form = "hub.mode=subscribe&hub.topic=%s&hub.callback=%s&hub.secret=%s" % (
+            Hub.topic(feed_url, i % 2 and "rss" or "atom"), "http://127.0.0.1:%d/cb" % server.server_port, SECRET)
+        status, headers, body = gae.request('/hub', {'Content-Type': 'application/x-www-form-urlencoded'}, 'POST', form)
+        assert status == 202, body
+    run_hub_tasks()
+
+    start = time.time()
+    for i in range(messages):
+        Ingest.store([{'recipients': ['websub' + config.SETTINGS['emaildomain']], 'sender': 'list@example.org',
+                       'subject': 'Update %d' % i, 'body': gae.sample_body(5000), 'messageId': '<%d@bench>' % i,
+                       'dateSent': None, 'dateReceived': datetime.datetime.now()}])
+    runs, failures = run_hub_tasks()
+    elapsed = time.time() - start
+
+    received = sum([server.received for server in servers])
+    print "%d subscribers verified, %d messages: %d deliveries (%d signed), %d tasks, %d failed and retried, %.1f s" % (
+        sum([server.verified for server in servers]), messages, received,
+        sum([server.signed for server in servers]), runs, failures, elapsed)
+    polls = subscribers * HOURS * 60 / poll_minutes
+    print "polling every %d minutes for %d hours: %d requests, with the hub: %d pushes (%.0f%% fewer)" % (
+        poll_minutes, HOURS, polls, received, (1 - float(received) / polls) * 100)
+    for server in servers:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,49 @@ PLATFORM_NAME = "email2feed"
 APPNAME = os.environ['APPLICATION_ID']
 #Maximum RSS/Atom Fetch
 MAX_FETCH = 50
+#Messages per page in the web view
+PAGE_SIZE = 25
+#Share of requests measured by util/Instrument.py (0 turns it off, 1 measures everything)
+INSTRUMENT_SAMPLE_RATE = 0.05
+#Retention, applied daily by /tasks/compact (None means no limit, accounts can override)
+RETAIN_MESSAGES = None
+RETAIN_DAYS = None
+RETAIN_BYTES = None
+#Longest message body stored, in characters (longer ones are truncated)
+MAX_BODY_SIZE = 512 * 1024
+#Longest excerpt, in characters, of a message in summary feeds (?mode=summary)
+SUMMARY_CHARS = 300
+#Images and attachments up to this many bytes are stored once each and linked from the body (/blob/), bigger ones are dropped
+BLOB_MAX_BYTES = 900 * 1024
+#Each feed's message count, size and newest message are split over this many entities
+FEED_COUNTER_SHARDS = 5
+#WebSub subscriptions last this many seconds unless the subscriber asks otherwise, and at most the second
+HUB_LEASE_SECONDS = 10 * 24 * 3600
+HUB_MAX_LEASE_SECONDS = 30 * 24 * 3600
+#Delta feeds (?since= or A-IM: feed) repeat entries received this many seconds before the reader's marker
+DELTA_OVERLAP = 300
+#Most feeds that can be combined into one, see /combined/
+MAX_COMBINED_FEEDS = 10
+#Most feeds of one account listed by /account/feeds and /account/opml
+MAX_ACCOUNT_FEEDS = 100
+#gzip level for feeds and pages (1 fastest - 9 smallest, 0 sends them uncompressed)
+COMPRESSION_LEVEL = 6
+#Rendered feed cache, per instance (number of feeds and total bytes)
+FEED_CACHE_ENTRIES = 200
+FEED_CACHE_BYTES = 16 * 1024 * 1024
+#Account lookup cache, per instance (number of keys and seconds to keep them)
+ACCOUNT_CACHE_ENTRIES = 3000
+ACCOUNT_CACHE_TTL = 600
+#Blob cache for /blob/, per instance (number of blobs and total bytes)
+BLOB_CACHE_ENTRIES = 500
+BLOB_CACHE_BYTES = 16 * 1024 * 1024
+#Inbound mail is stored in batches of up to this many messages...
+INGEST_BATCH_SIZE = 100
+#...by a worker that starts this many seconds after the first queued message
+INGEST_BATCH_DELAY = 2
+#Duplicate deliveries are recognised for this many seconds, remembering up to this many per instance
+DEDUP_WINDOW = 2 * 24 * 3600
+DEDUP_ENTRIES = 10000
 
 #User Settings
 
@@ -47,6 +90,31 @@ SETTINGS = {
     'maxusername': MAX_USERNAME_CHAR,
     'trustedmode': TRUSTED_MODE,
     'maxfetch': MAX_FETCH,
+    'pagesize': PAGE_SIZE,
+    'max_body_size': MAX_BODY_SIZE,
+    'summary_chars': SUMMARY_CHARS,
+    'blob_max_bytes': BLOB_MAX_BYTES,
+    'instrument_sample_rate': INSTRUMENT_SAMPLE_RATE,
+    'retain_messages': RETAIN_MESSAGES,
+    'retain_days': RETAIN_DAYS,
+    'retain_bytes': RETAIN_BYTES,
+    'max_combined_feeds': MAX_COMBINED_FEEDS,
+    'max_account_feeds': MAX_ACCOUNT_FEEDS,
+    'delta_overlap': DELTA_OVERLAP,
+    'hub_lease_seconds': HUB_LEASE_SECONDS,
+    'hub_max_lease_seconds': HUB_MAX_LEASE_SECONDS,
+    'feed_counter_shards': FEED_COUNTER_SHARDS,
+    'compression_level': COMPRESSION_LEVEL,
+    'feedcache_entries': FEED_CACHE_ENTRIES,
+    'feedcache_bytes': FEED_CACHE_BYTES,
+    'accountcache_entries': ACCOUNT_CACHE_ENTRIES,
+    'accountcache_ttl': ACCOUNT_CACHE_TTL,
+    'blobcache_entries': BLOB_CACHE_ENTRIES,
+    'blobcache_bytes': BLOB_CACHE_BYTES,
+    'ingest_batch_size': INGEST_BATCH_SIZE,
+    'ingest_batch_delay': INGEST_BATCH_DELAY,
+    'dedup_window': DEDUP_WINDOW,
+    'dedup_entries': DEDUP_ENTRIES,
     'unavailable_names': UNAVAILABLE_NAMES, 
     'platform': PLATFORM_NAME,
     'feed_url_length':URL_LENGTH
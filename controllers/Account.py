@@ -0,0 +1,142 @@
+from google.appengine.api import users
+from google.appengine.ext import webapp
+from models.models import MailMessage, UserDetails
+from Base import App
+from util import Accounts, Compression, FeedCache, FeedStats, Templates
+import config, datetime, hashlib
+try:
+    import json
+except ImportError:
+    from django.utils import simplejson as json
+
+# Everything the logged-in user owns in one response, for people with many
+# addresses: their feeds with the newest entries of each as JSON, and an
+# OPML list of the feeds to subscribe to all of them at once. The accounts
+# come from one query, the totals from one memcache call (FeedStats) and the
+# versions from another (FeedCache); only feeds with mail are queried for
+# entries, and their bodies are read with one batch get.
+#
+# Feeds registered before they were tied to a user, or without logging in,
+# have no owner until an administrator assigns one (/tasks/assign-owner).
+
+def feed_links(account):
+    """Web, RSS and Atom urls of an account's feed"""
+    return {'web': config.SETTINGS['url'] + "/view/" + account.feedUrl,
+            'rss': config.SETTINGS['url'] + "/rss/" + account.feedUrl,
+            'atom': config.SETTINGS['url'] + "/" + account.feedUrl}
+
+def timestamp(date):
+    return date and date.strftime("%Y-%m-%dT%H:%M:%SZ") or None
+
+class JsonHandler(webapp.RequestHandler):
+    def reply(self, data):
+        self.response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        self.response.out.write(json.dumps(data))
+
+    def fail(self, status, message):
+        self.response.set_status(status)
+        self.reply({'error': message})
+
+class Feeds(JsonHandler): #the user's feeds and their newest entries as JSON, and their settings
+    def get(self):
+        user = Accounts.current()[0]
+        if not user:
+            return self.fail(401, "Sign in to list your feeds")
+        try:
+            entries = int(self.request.get('entries') or config.SETTINGS['pagesize']) #0 for totals only
+        except ValueError:
+            return self.fail(400, "entries must be a number")
+        entries = max(0, min(entries, config.SETTINGS['maxfetch']))
+        bodies = self.request.get('bodies') == '1'
+        accounts = Accounts.owned(user)
+        wanted = [feed_url for feed_url in self.request.get('feeds').split(",") if feed_url] #all when empty
+        if wanted:
+            accounts = [account for account in accounts if account.feedUrl in wanted]
+
+        # one validator for the lot, current while every feed in it is
+        feed_urls = [account.feedUrl for account in accounts]
+        states = FeedCache.states(feed_urls)
+        dates = [modified for version, modified in states]
+        last_modified = None
+        if dates and None not in dates:
+            last_modified = max(dates)
+        versions = " ".join([user.email(), str(entries), str(bodies)] +
+                            ["%s:%s" % (feed_url, state[0]) for feed_url, state in zip(feed_urls, states)])
+        self.response.headers['Cache-Control'] = 'private'
+        if App().not_modified(self, "account-" + hashlib.sha1(versions.encode('utf-8')).hexdigest()[:16], last_modified):
+            return
+
+        totals = FeedStats.get_multi(feed_urls)
+        latest = {}
+        if entries:
+            for account in accounts:
+                if totals[account.feedUrl]['messages']:
+                    email = account.emailName + config.SETTINGS['emaildomain']
+                    latest[account.feedUrl] = MailMessage.all().filter("toAddress = ", email).order("-dateReceived").fetch(entries)
+            if bodies:
+                MailMessage.load_content(sum(latest.values(), []))
+
+        feeds = []
+        for account in accounts:
+            feed = {'feed': account.feedUrl,
+                    'email': account.emailName + config.SETTINGS['emaildomain'],
+                    'messages': totals[account.feedUrl]['messages'],
+                    'bytes': totals[account.feedUrl]['bytes'],
+                    'latest': timestamp(totals[account.feedUrl]['latest']),
+                    'summaryMode': bool(account.summaryMode)}
+            feed.update(feed_links(account))
+            if entries:
+                feed['entries'] = []
+                for message in latest.get(account.feedUrl, []):
+                    entry = {'id': message.key().id(),
+                             'subject': message.subject,
+                             'from': message.fromAddress,
+                             'received': timestamp(message.dateReceived),
+                             'size': message.size,
+                             'summary': message.summary,
+                             'link': feed['web'] + "/" + str(message.key().id())}
+                    if bodies:
+                        entry['body'] = message.body
+                    feed['entries'].append(entry)
+            feeds.append(feed)
+        self.response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        Compression.write(self, json.dumps({'feeds': feeds}))
+
+    def post(self):
+        """Sets a feed's summaryMode: feed=<feed url>&mode=summary or full"""
+        user = Accounts.current()[0]
+        if not user:
+            return self.fail(401, "Sign in to change your feeds")
+        mode = self.request.get('mode')
+        if mode not in ("summary", "full"):
+            return self.fail(400, "mode must be summary or full")
+        account = Accounts.by_feed_url(self.request.get('feed'))
+        if account is not None and account.accountName is None: #registered before owners were recorded
+            return self.fail(403, "This feed has no owner yet, ask the administrator to assign it to you")
+        if account is None or account.accountName != user:
+            return self.fail(404, "No such feed of yours")
+        account = UserDetails.get(account.key()) #the cached copy may be stale
+        account.summaryMode = mode == "summary"
+        account.put()
+        Accounts.add(account)
+        FeedCache.invalidate(account.feedUrl) #other instances follow once their account cache expires
+        self.reply({'feed': account.feedUrl, 'summaryMode': account.summaryMode})
+
+class Opml(webapp.RequestHandler): #the user's feeds as an OPML subscription list
+    def get(self):
+        user = Accounts.current()[0]
+        if not user:
+            self.redirect(users.create_login_url(self.request.uri))
+            return
+        format = self.request.get('format') == 'atom' and 'atom' or 'rss'
+        outlines = []
+        for account in Accounts.owned(user):
+            links = feed_links(account)
+            outlines.append({'title': account.emailName + config.SETTINGS['emaildomain'],
+                             'xml_url': links[format], 'html_url': links['web']})
+        view_data = {'title': config.SETTINGS['platform'] + " feeds of " + user.email(),
+                     'created': datetime.datetime.utcnow(), 'outlines': outlines}
+        self.response.headers['Content-Type'] = 'text/x-opml; charset=utf-8'
+        self.response.headers['Content-Disposition'] = 'attachment; filename="%s.opml"' % config.SETTINGS['appname']
+        self.response.headers['Cache-Control'] = 'private'
+        Compression.write(self, Templates.render('view/opml.xml', view_data))
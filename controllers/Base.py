@@ -1,53 +1,61 @@
 import os
-import sys
-from google.appengine.ext import webapp
-from models.models import MailMessage
-from google.appengine.ext.webapp import template
 from google.appengine.api import users
-from models.models import UserDetails
-import main
-from urlparse import urlparse
-import datetime
-import config
+from util import Accounts, Compression
+from email.utils import formatdate, parsedate_tz, mktime_tz
+import config, cgi
+
+#the part of every page's data that only depends on the settings
+BASE_DATA = {
+             'base_title'   :   config.SETTINGS['platform']
+            ,'hostname'     :   config.SETTINGS['hostname']
+            ,'emaildomain'  :   config.SETTINGS['emaildomain']
+            }
+RSS_LINK = '<link rel="alternate" type="application/rss+xml" title="%(name)s feed at email2feed" href="/rss/%(name)s">'
+ATOM_LINK = '<link rel="alternate"  type="application/atom+xml"  title="%(name)s feed at email2feed" href="/%(name)s">'
+
+_auth_links = {} #(host, logged in) -> login or logout url, they only vary by host
         
 class App():    
     def data(self, view_data):
         
-        view_data['logged_in'] = False        
-        view_data['base_title'] = config.SETTINGS['platform']
-        view_data['hostname'] = config.SETTINGS['hostname']
-        view_data['emaildomain'] = config.SETTINGS['emaildomain']
+        view_data.update(BASE_DATA)
         if view_data.get('errors'):
             error_codes = view_data['errors']
         else:
             error_codes = [] 
-        user = users.get_current_user()
-        if user:  
-            view_data['logged_in'] = True
-            view_data['auth_link'] = users.create_logout_url("/")
-            
-            current_users = UserDetails.gql("WHERE accountName = :1 LIMIT 1",user) 
-            if current_users:
-                view_data['account_name'] = current_users[0].emailName                        
-        else:
-            view_data['auth_link'] = users.create_login_url("/")    
-        
+        user, current_user = Accounts.current()
+        view_data['logged_in'] = bool(user)
+        view_data['auth_link'] = self.auth_link(bool(user))
+        if current_user:
+            view_data['account_name'] = current_user.emailName                        
         
         if view_data.get('user_get'):               
             view_data['account_exists'] = self.feed_exists(view_data['user_get'])
-            view_data['rss_link'] = '<link rel="alternate" type="application/rss+xml" title="'+ view_data.get('user_get')  +' feed at email2feed" href="/rss/' + view_data.get('user_get')  + '">'
-            view_data['atom_link'] = '<link rel="alternate"  type="application/atom+xml"  title="'+ view_data.get('user_get')  +' feed at email2feed" href="/' + view_data.get('user_get')  + '">'
+            name = {'name': cgi.escape(view_data['user_get'], True)}
+            view_data['rss_link'] = RSS_LINK % name
+            view_data['atom_link'] = ATOM_LINK % name
         
         view_data['errors'] =  self.app_errors(error_codes)
         
         return view_data   
     
+    def auth_link(self, logged_in):
+        key = (os.environ.get('HTTP_HOST'), logged_in)
+        link = _auth_links.get(key)
+        if link is None:
+            if logged_in:
+                link = users.create_logout_url("/")
+            else:
+                link = users.create_login_url("/")
+            _auth_links[key] = link
+        return link
+    
     def account_exists(self, account_name): 
         exists = False    
-        existing_users = UserDetails.gql("WHERE accountName = :1 LIMIT 1",account_name)
-        for existing_user in existing_users:             
+        existing_user = Accounts.by_account(account_name)
+        if existing_user:
             exists = True
-            account_name =  existing_users[0].emailName
+            account_name =  existing_user.emailName
             
         account = {}
         account['exists'] = exists
@@ -55,15 +63,49 @@ class App():
         return account
     
        
-    def feed_exists(feed_name):
-        exists = False    
-        existing_feeds = UserDetails.gql("WHERE emailName = :1 LIMIT 1",feed_name) 
-        for existing_feed in existing_feeds:                     
-            exists = True       
-               
-        return exists
+    def feed_exists(self, feed_name):
+        return Accounts.by_email_name(feed_name) is not None
     
     
+    def not_modified(self, handler, etag, last_modified=None, compressed=True):
+        """Sets ETag/Last-Modified on the response and answers conditional GETs.
+
+        last_modified is in seconds since the epoch. Returns True when a 304 was
+        sent, in which case the handler should stop without rendering anything.
+        compressed is False for responses that never go through
+        Compression.write; the others also match the ETag of their gzip copy.
+        """
+        etag = '"' + etag + '"'
+        gzip_etag = Compression.gzip_etag(etag)
+        handler.response.headers['ETag'] = etag
+        if compressed:
+            Compression.vary(handler)
+        if last_modified:
+            handler.response.headers['Last-Modified'] = formatdate(last_modified, usegmt=True)
+
+        matched = False
+        if_none_match = handler.request.headers.get('If-None-Match')
+        if if_none_match: #If-None-Match wins over If-Modified-Since
+            for tag in if_none_match.split(','):
+                tag = tag.strip()
+                if tag.startswith('W/'):
+                    tag = tag[2:]
+                if tag == etag or tag == '*':
+                    matched = True
+                elif compressed and tag == gzip_etag:
+                    handler.response.headers['ETag'] = gzip_etag
+                    matched = True
+        elif last_modified:
+            if_modified_since = handler.request.headers.get('If-Modified-Since')
+            if if_modified_since:
+                since = parsedate_tz(if_modified_since.split(';')[0])
+                if since and mktime_tz(since) >= int(last_modified):
+                    matched = True
+
+        if matched:
+            handler.response.set_status(304)
+        return matched
+
     def app_errors(self, error_codes):
         
         error_output = []
@@ -0,0 +1,22 @@
+from google.appengine.ext import webapp
+from Base import App
+from util import Blobs
+
+class Show(webapp.RequestHandler): #an image or attachment of a message, see util/Blobs.py
+    def get(self, digest):
+        blob = Blobs.get(digest) #first, so no 304 for a blob that is gone
+        if blob is None:
+            self.error(404)
+            return
+        # the url names the content, so it can be cached for good
+        self.response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        if App().not_modified(self, digest, compressed=False):
+            return
+        content_type, data = blob
+        if content_type in Blobs.SAFE_TYPES:
+            self.response.headers['Content-Type'] = str(content_type)
+        else: #never rendered on our domain
+            self.response.headers['Content-Type'] = 'application/octet-stream'
+            self.response.headers['Content-Disposition'] = 'attachment'
+        self.response.headers['X-Content-Type-Options'] = 'nosniff'
+        self.response.out.write(data)
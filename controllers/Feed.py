@@ -1,28 +1,51 @@
-import os
-import sys
 from google.appengine.ext import webapp
 from models.models import MailMessage
-from google.appengine.ext.webapp import template
 from google.appengine.api import users
-from models.models import UserDetails
-import main
-from urlparse import urlparse
 import datetime
 from libs import PyRSS2Gen
 import config
 from Base import App
+from util import Accounts, Compression, FeedCache, FeedStats, Fragments, Hub, Search, Templates
+import calendar, hashlib, heapq, urllib
+
+def page_marker(date):
+    """dateReceived as a url-safe paging marker (microseconds since the epoch)"""
+    if date is None:
+        return ""
+    return str(calendar.timegm(date.timetuple()) * 1000000 + date.microsecond)
+
+def from_page_marker(marker):
+    """Inverse of page_marker, None if the marker is missing or malformed"""
+    try:
+        value = int(marker)
+        return datetime.datetime.utcfromtimestamp(value // 1000000).replace(microsecond=value % 1000000)
+    except (ValueError, TypeError):
+        return None
         
 class ShowAll(webapp.RequestHandler): #Displays the user's web feed
     def get(self, feed_url):                    
+        
+        # the page shows who is logged in, so the validator is per user
+        user = users.get_current_user()
+        if user:
+            viewer = user.user_id()
+        else:
+            viewer = "anon"
+        before = from_page_marker(self.request.get('before'))
+        after = from_page_marker(self.request.get('after'))
        
         account_exists = empty = False   
         emailName = ""
        
         
-        existingUsers = UserDetails.gql("WHERE feedUrl = :1 LIMIT 1",feed_url) 
-        for existingUser in existingUsers:
+        existingUser = Accounts.by_feed_url(feed_url)
+        if existingUser:
             email_name = existingUser.emailName
             account_exists = True
+            # only feeds that exist get a version, and a validator
+            feed_version = FeedCache.version(feed_url)
+            if App().not_modified(self, "view-%s-%s-%s-%s" % (feed_version, viewer, page_marker(before), page_marker(after))):
+                return
             
         if account_exists:
             feed_path = feed_url      
@@ -31,27 +54,74 @@ class ShowAll(webapp.RequestHandler): #Displays the user's web feed
             user_email = email_name + config.SETTINGS['emaildomain']           
             app = App()            
             
-            emails = MailMessage.all().filter("toAddress = ", user_email).order("-dateReceived")      
-            emailCount = emails.count() 
-            if emailCount == 0:
+            # keyset paging on (toAddress, dateReceived), one extra row tells if there is another page
+            page_size = config.SETTINGS['pagesize']
+            emails = MailMessage.all().filter("toAddress = ", user_email)
+            if after:
+                emails.filter("dateReceived >", after).order("dateReceived")
+                page = emails.fetch(page_size + 1)
+                has_newer = len(page) > page_size
+                has_older = True
+                page = page[:page_size]
+                page.reverse()
+            else:
+                if before:
+                    emails.filter("dateReceived <", before)
+                emails.order("-dateReceived")
+                page = emails.fetch(page_size + 1)
+                has_older = len(page) > page_size
+                has_newer = before is not None
+                page = page[:page_size]
+
+            newer_url = older_url = ""
+            if page:
+                if has_newer:
+                    newer_url = "/view/" + feed_path + "?after=" + page_marker(page[0].dateReceived)
+                if has_older:
+                    older_url = "/view/" + feed_path + "?before=" + page_marker(page[-1].dateReceived)
+            elif not before and not after:
                 empty = True 
-            this_data = { 'emails':emails, 'to':user_email,  'authControl':users.create_login_url("/"), 'empty': empty, 'feed_url':feed_url, 'feed_path':feed_path, 'account_exists':account_exists}      
+            this_data = { 'emails':page, 'to':user_email, 'empty': empty, 'feed_url':feed_url, 'feed_path':feed_path, 'account_exists':account_exists, 'newer_url':newer_url, 'older_url':older_url, 'message_count':FeedStats.get(feed_path)['messages']}      
                       
             
            
             view_data = app.data(this_data)
                     
-            path = os.path.join(main.ROOT_DIR, 'views/view/web.html')
-            self.response.out.write(template.render(path, view_data))
+            Compression.write(self, Templates.render('view/web.html', view_data))
         else: 
             self.redirect("/#")      
 
+class SearchFeed(webapp.RequestHandler): #search a user's web feed, best matches first
+    def get(self, feed_url):
+        existingUser = Accounts.by_feed_url(feed_url)
+        if not existingUser:
+            self.redirect("/#")
+            return
+        query = self.request.get('q')
+        try:
+            page = max(int(self.request.get('page') or 0), 0)
+        except ValueError:
+            page = 0
+        page_size = config.SETTINGS['pagesize']
+        total, ids = Search.search(feed_url, query, page * page_size, page_size)
+        emails = [email for email in MailMessage.get_by_id(ids) if email] #one batch get for the page
+        
+        search_url = "/view/" + feed_url + "/search?" + urllib.urlencode({'q': query.encode('utf-8')})
+        newer_url = older_url = ""
+        if page:
+            newer_url = search_url + "&page=" + str(page - 1)
+        if (page + 1) * page_size < total:
+            older_url = search_url + "&page=" + str(page + 1)
+        this_data = {'emails':emails, 'q':query, 'total':total, 'to':existingUser.emailName + config.SETTINGS['emaildomain'], 'feed_path':feed_url, 'account_exists':True, 'newer_url':newer_url, 'older_url':older_url}
+        view_data = App().data(this_data)
+        Compression.write(self, Templates.render('view/search.html', view_data))
+
 class ShowMessage(webapp.RequestHandler): #show message by id
     def get(self, feed_url, messageid):    
         
          
-        existingUsers = UserDetails.gql("WHERE feedUrl = :1 LIMIT 1",feed_url) 
-        for existingUser in existingUsers:
+        existingUser = Accounts.by_feed_url(feed_url)
+        if existingUser:
             email_name = existingUser.emailName
             account_exists = True
         USER_EMAIL = email_name + config.SETTINGS['emaildomain']       
@@ -70,96 +140,330 @@ class ShowMessage(webapp.RequestHandler): #show message by id
         prev_url = ""
         
         next_url = ""
-               
+        if email: #neighbours in feed order (newest first), keys only
+            siblings = MailMessage.all(keys_only=True).filter("toAddress = ", USER_EMAIL)
+            newer = siblings.filter("dateReceived >", email.dateReceived).order("dateReceived").fetch(1)
+            if newer:
+                prev_url = "/view/" + feed_url + "/" + str(newer[0].id())
+            siblings = MailMessage.all(keys_only=True).filter("toAddress = ", USER_EMAIL)
+            older = siblings.filter("dateReceived <", email.dateReceived).order("-dateReceived").fetch(1)
+            if older:
+                next_url = "/view/" + feed_url + "/" + str(older[0].id())
             
-        this_data = { 'email':email, 'to':USER_EMAIL, 'user':email_name, 'account_exists':account_exists, 'empty': empty, 'feed_url':feed_url[2], 'feed_url':feed_url, 'prev_url':prev_url}      
+        this_data = { 'email':email, 'to':USER_EMAIL, 'user':email_name, 'account_exists':account_exists, 'empty': empty, 'feed_url':feed_url[2], 'feed_url':feed_url, 'prev_url':prev_url, 'next_url':next_url}      
         
         app = App()
         view_data = app.data(this_data)
         
-        path = os.path.join(main.ROOT_DIR, 'views/view/web-single.html')
-        self.response.out.write(template.render(path, view_data))   
+        Compression.write(self, Templates.render('view/web-single.html', view_data))   
            
         
-class ShowRSS(webapp.RequestHandler): #Displays the RSS feed
-    def get(self, feed_url):     
-        account_exists = False
-        existingUsers = UserDetails.gql("WHERE feedUrl = :1 LIMIT 1",feed_url) 
-        for existingUser in existingUsers:
-            email_name = existingUser.emailName
-            account_exists = True
-            
-        if account_exists:
-            FEED_TITLE = email_name + " - email2feed"
-            FEED_URL = "http://"+config.SETTINGS['hostname']+"/rss/"+feed_url      
-            USER_EMAIL = email_name + config.SETTINGS['emaildomain']  # ex. user@appid.appspotmail.com
-            USER_LINK = config.SETTINGS['url'] + "/view/" + feed_url   
-            
-            messages = MailMessage.all().filter("toAddress = ", USER_EMAIL).order("-dateReceived") #Get all emails for the current user     
-            results = messages.fetch(config.SETTINGS['maxfetch'])  
-            rss_items = []
+CONTENT_TYPES = {'rss': 'application/rss+xml', 'atom': 'application/atom+xml'}
+
+class HubRSS2(PyRSS2Gen.RSS2):
+    """RSS2 with the atom:link elements WebSub subscribers look for"""
+    rss_attrs = {"version": "2.0", "xmlns:atom": "http://www.w3.org/2005/Atom"}
+    def publish_extensions(self, handler):
+        for rel, href in (("hub", Hub.hub_url()), ("self", self.link)):
+            handler.startElement("atom:link", {"rel": rel, "href": href})
+            handler.endElement("atom:link")
+
+def summary_mode(existingUser, mode):
+    """True for excerpts: ?mode=summary or ?mode=full, otherwise the feed's own setting"""
+    if mode in ("summary", "full"):
+        return mode == "summary"
+    return bool(existingUser and existingUser.summaryMode)
+
+def feed_variant(format, summary):
+    """The FeedCache format of a feed document, see FeedCache.MODES"""
+    return summary and format + ":summary" or format
+
+def feed_entry(format, msg, feed_url, summary):
+    """A message as an RSS item or Atom entry, whole or as an excerpt; rendered at ingest unless it predates that"""
+    if format == "rss":
+        if summary:
+            return Fragments.rss_summary(msg, feed_url)
+        return msg.rssItem or Fragments.rss_item(msg, feed_url)
+    if summary:
+        return Fragments.atom_summary(msg, feed_url)
+    return msg.atomEntry or Fragments.atom_entry(msg, feed_url)
+
+def feed_document(feed_url, format, feed_version=None, summary=None):
+    """A feed's RSS or Atom document, cached or rendered. None if there is no such feed
+
+    summary None follows the feed's setting.
+    """
+    existingUser = Accounts.by_feed_url(feed_url)
+    if existingUser is None:
+        return None
+    if summary is None:
+        summary = summary_mode(existingUser, None)
+    if feed_version is None:
+        feed_version = FeedCache.version(feed_url)
+    document = FeedCache.get(feed_url, feed_variant(format, summary), feed_version)
+    if document is None:
+        if format == "rss":
+            document = rss_document(feed_url, existingUser, summary=summary)
+        else:
+            document = atom_document(feed_url, existingUser, summary=summary)
+        FeedCache.put(feed_url, feed_variant(format, summary), feed_version, document)
+    return document
+
+def feed_messages(existingUser, since=None, bodies=True):
+    """The newest MAX_FETCH messages of a feed, only those received after since if given
+
+    Without bodies only messages stored without an excerpt get theirs loaded.
+    """
+    messages = MailMessage.all().filter("toAddress = ", existingUser.emailName + config.SETTINGS['emaildomain'])
+    if since is not None:
+        messages.filter("dateReceived >", since)
+    results = messages.order("-dateReceived").fetch(config.SETTINGS['maxfetch'])
+    if bodies:
+        MailMessage.load_content(results) #all bodies in one batch get
+    else:
+        MailMessage.load_content([message for message in results if message.summary is None])
+    return results
+
+def rss_document(feed_url, existingUser, results=None, summary=False):
+    email_name = existingUser.emailName
+    FEED_TITLE = email_name + " - email2feed"
+    FEED_URL = Hub.topic(feed_url, "rss")
+    USER_EMAIL = email_name + config.SETTINGS['emaildomain']  # ex. user@appid.appspotmail.com
+    
+    if results is None:
+        results = feed_messages(existingUser, bodies=not summary)
+    rss_items = []
+    
+    #Feed Message Data
+    for msg in results:
+        rss_items.append(PyRSS2Gen.RawXml(feed_entry("rss", msg, feed_url, summary)))
+
+    #Feed Title Data
+    rss = HubRSS2(title=FEED_TITLE,
+                  link=FEED_URL,
+                  description=USER_EMAIL,
+                  lastBuildDate=datetime.datetime.now(),
+                  items=rss_items
+                 )
+    return "".join(rss.iter_xml()) #item by item, no intermediate document
+
+def atom_document(feed_url, existingUser, results=None, summary=False):
+    email_name = existingUser.emailName
+    FEED_TITLE = email_name + " - email2feed"
+    FEED_URL = Hub.topic(feed_url, "atom")
+    USER_EMAIL = email_name + config.SETTINGS['emaildomain']  # ex. user@appid.appspotmail.com  
+    
+    if results is None:
+        results = feed_messages(existingUser, bodies=not summary)
+    
+    latestMessageVal = FeedStats.get(feed_url)['latest'] #kept at ingest, see util/FeedStats.py
+    if latestMessageVal is None and results: #not counted yet
+        latestMessageVal = results[0].dateReceived
             
-            #Feed Message Data
-            for msg in results:
-                genlink = USER_LINK + "/" + str(msg.key().id())
-                item = PyRSS2Gen.RSSItem(title=msg.subject,description=msg.body,pubDate=msg.dateReceived,guid = PyRSS2Gen.Guid(genlink),link=genlink) #subject, body, date received, test guid
-                rss_items.append(item) 
+    this_data = {
+                 "feedTitle"    :   FEED_TITLE
+                ,"feedUrl"      :   FEED_URL
+                ,"hubUrl"       :   Hub.hub_url()
+                ,"updated"      :   latestMessageVal or ""
+                ,"name"         :   email_name
+                ,"email"        :   USER_EMAIL
+                }     
+    app = App()
+    view_data = app.data(this_data)      
+   
+    parts = [Fragments.text(Templates.render('view/atom-head.xml', view_data))]
+    for msg in results:
+        parts.append(feed_entry("atom", msg, feed_url, summary))
+    parts.append(u"\n</feed>")
+    return u"".join(parts)
+
+class FeedHandler(webapp.RequestHandler):
+    """Serves a feed whole, or only what a reader hasn't seen yet.
+
+    A reader asks for the entries received after a marker with ?since=
+    (a page marker, see page_marker), or sends "A-IM: feed" (RFC 3229) with
+    the ETag of the copy it has and gets a 226 with the newer entries. The
+    ETag carries the feed's last change time for that. Entries received
+    within DELTA_OVERLAP seconds before the marker are sent again, because
+    mail can be stored a little after a later message; readers drop the
+    repeats by guid.
+
+    ?mode=summary serves excerpts instead of whole bodies and ?mode=full the
+    bodies, whatever the feed's summaryMode says.
+    """
+    def serve(self, feed_url, format):
+        # the catch-all route ends up here: no version, no 304 for a feed that doesn't exist
+        existingUser = Accounts.by_feed_url(feed_url)
+        if existingUser is None:
+            self.redirect("/#")
+            return
+        feed_version, last_modified = FeedCache.state(feed_url)
+        Hub.advertise(self, Hub.topic(feed_url, format))
+        self.response.headers['Vary'] = 'A-IM'
+        summary = summary_mode(existingUser, self.request.get('mode'))
+        variant = feed_variant(format, summary)
+        etag = "%s-%s-%s" % (variant, feed_version, last_modified or 0)
+        since = from_page_marker(self.request.get('since'))
+        if since is not None:
+            etag += "-since" + page_marker(since)
+        if App().not_modified(self, etag, last_modified):
+            return
+        instance_manipulation = False
+        if since is None and 'feed' in [im.strip() for im in self.request.headers.get('A-IM', '').split(',')]:
+            since = self.seen_until(variant)
+            instance_manipulation = since is not None
+        
+        if since is not None:
+            results = feed_messages(existingUser, since - datetime.timedelta(seconds=config.SETTINGS['delta_overlap']),
+                                    not summary)
+            if len(results) < config.SETTINGS['maxfetch']: #otherwise the whole (cached) feed is as small
+                if format == "rss":
+                    document = rss_document(feed_url, existingUser, results, summary)
+                else:
+                    document = atom_document(feed_url, existingUser, results, summary)
+                if instance_manipulation:
+                    self.response.set_status(226, 'IM Used')
+                    self.response.headers['IM'] = 'feed'
+                    self.response.headers['Cache-Control'] = 'no-store, im'
+                self.response.headers['Content-Type'] = CONTENT_TYPES[format]
+                Compression.write(self, document)
+                return
+        
+        document = feed_document(feed_url, format, feed_version, summary)
+        if document is not None:
+            self.response.headers['Content-Type'] = CONTENT_TYPES[format]
+            Compression.write(self, document, (feed_url, variant, feed_version))
+        else:
+            self.redirect("/#")
     
-            #Feed Title Data
+    def seen_until(self, variant):
+        """When the copy named by If-None-Match was current, None if it isn't one of ours"""
+        for tag in self.request.headers.get('If-None-Match', '').split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            tag = tag.strip('"')
+            if tag.endswith(Compression.ETAG_SUFFIX):
+                tag = tag[:-len(Compression.ETAG_SUFFIX)]
+            parts = tag.split('-')
+            if len(parts) == 3 and parts[0] == variant and parts[2].isdigit() and int(parts[2]):
+                return datetime.datetime.utcfromtimestamp(int(parts[2]))
+        return None
+
+class ShowRSS(FeedHandler): #Displays the RSS feed
+    def get(self, feed_url):     
+        self.serve(feed_url, "rss")
+        
+class ShowAtom(FeedHandler):    
+    def get(self, feed_url): 
+        self.serve(feed_url, "atom")
+
+def stream(query, chunk):
+    """A newest-first query as an iterator, fetched in chunks as it's consumed"""
+    while True:
+        results = query.fetch(chunk)
+        for message in results:
+            yield message
+        if len(results) < chunk:
+            return
+        query.with_cursor(query.cursor())
+        chunk = min(chunk * 2, config.SETTINGS['maxfetch'])
+
+def merged(streams, limit):
+    """The newest limit messages of several newest-first streams, as (message, stream index)
+
+    The heap holds only the next message of each stream, so no stream is
+    read further than the merged result needs.
+    """
+    heap = []
+    def push(index, messages):
+        for message in messages:
+            heapq.heappush(heap, (-int(page_marker(message.dateReceived) or 0), index, message, messages))
+            break
+    for index, messages in enumerate(streams):
+        push(index, messages)
+    results = []
+    while heap and len(results) < limit:
+        marker, index, message, messages = heapq.heappop(heap)
+        results.append((message, index))
+        push(index, messages)
+    return results
+
+class ShowCombined(webapp.RequestHandler): #One RSS or Atom feed merged from several feeds of an account
+    def get(self, format, feed_paths):
+        feed_urls = []
+        for feed_url in feed_paths.split(","):
+            if feed_url and feed_url not in feed_urls:
+                feed_urls.append(feed_url)
+        if not feed_urls or len(feed_urls) > config.SETTINGS['max_combined_feeds']:
+            self.error(404)
+            return
+        
+        accounts = [Accounts.by_feed_url(feed_url) for feed_url in feed_urls]
+        owners = {}
+        for account in accounts:
+            owners[account and account.accountName and account.accountName.email()] = True
+        if None in owners or len(owners) > 1: #only feeds that exist and have the same owner
+            self.redirect("/#")
+            return
+        
+        # each feed whole or as excerpts, as FeedHandler.serve would serve it
+        summaries = [summary_mode(account, self.request.get('mode')) for account in accounts]
+        modes = "".join([summary and "s" or "f" for summary in summaries])
+        
+        # the combined copy is current while every feed in it is
+        states = FeedCache.states(feed_urls)
+        feed_version = hashlib.sha1(" ".join([str(version) for version, modified in states])).hexdigest()[:16]
+        last_modified = None
+        if None not in [modified for version, modified in states]:
+            last_modified = max([modified for version, modified in states])
+        if App().not_modified(self, "combined-%s-%s-%s" % (format, modes, feed_version), last_modified):
+            return
+        cache_key = "combined:" + modes + ":" + ",".join(feed_urls)
+        content_type = CONTENT_TYPES[format]
+        cached = FeedCache.get(cache_key, format, feed_version)
+        if cached is not None:
+            self.response.headers['Content-Type'] = content_type
+            Compression.write(self, cached, (cache_key, format, feed_version))
+            return
+        
+        emails = [account.emailName + config.SETTINGS['emaildomain'] for account in accounts]
+        chunk = config.SETTINGS['maxfetch'] // len(accounts) + 1 #enough when the feeds are evenly interleaved
+        streams = [stream(MailMessage.all().filter("toAddress = ", email).order("-dateReceived"), chunk) for email in emails]
+        results = merged(streams, config.SETTINGS['maxfetch'])
+        #all bodies needed in one batch get: excerpts only need the body of messages stored without one
+        MailMessage.load_content([msg for msg, index in results if not summaries[index] or msg.summary is None])
+        
+        FEED_TITLE = ", ".join([account.emailName for account in accounts]) + " - email2feed"
+        FEED_URL = "http://"+config.SETTINGS['hostname']+"/combined/"+format+"/"+",".join(feed_urls)
+        self.response.headers['Content-Type'] = content_type
+        if format == "rss":
+            rss_items = []
+            for msg, index in results: #each item links to the feed it came from
+                rss_items.append(PyRSS2Gen.RawXml(feed_entry("rss", msg, feed_urls[index], summaries[index])))
             rss = PyRSS2Gen.RSS2(title=FEED_TITLE,
                                  link=FEED_URL,
-                                 description=USER_EMAIL,
+                                 description=", ".join(emails),
                                  lastBuildDate=datetime.datetime.now(),
                                  items=rss_items
                                 )
-            
-            rss_xml = rss.to_xml()
-            self.response.headers['Content-Type'] = 'application/rss+xml'
-            self.response.out.write(rss_xml)
+            document = "".join(rss.iter_xml())
         else:
-            self.redirect("/#")
-        
-class ShowAtom(webapp.RequestHandler):    
-    def get(self, feed_url): 
-        account_exists = False
-        existingUsers = UserDetails.gql("WHERE feedUrl = :1 LIMIT 1",feed_url) 
-        for existingUser in existingUsers:
-            email_name = existingUser.emailName
-            account_exists = True
-        
-        if account_exists:
-            FEED_TITLE = email_name + " - email2feed"
-            FEED_URL = "http://"+config.SETTINGS['hostname']+"/"+feed_url     
-            FEED_URL_VIEW = "http://"+config.SETTINGS['hostname']+"/view/"+feed_url     
-            USER_EMAIL = email_name + config.SETTINGS['emaildomain']  # ex. user@appid.appspotmail.com  
-            USER_LINK = config.SETTINGS['url'] + "/view/" + feed_url
-            latestMessageVal = "";
-            
-            messages = MailMessage.all().filter("toAddress = ", USER_EMAIL).order("-dateReceived")
-            results = messages.fetch(config.SETTINGS['maxfetch'])  
-            
-            latestEmailQry = MailMessage.all().filter("toAddress = ", USER_EMAIL).order("-dateReceived")
-            latestMessageFtch = latestEmailQry.fetch(1)
-            for latestMessage in latestMessageFtch:    
-                latestMessageVal = latestMessage.dateReceived   
-                    
-            footer = "<div style='clear:both;text-align: right; width:100%'><span style='color:#4E83B9'>email<span style='color:#1A4979; font-weight: bold;'>2</span><span style='color:#4E83B9'>feed</span> | <a target='_blank' style='color:#4E83B9;text-decoration: none;' href='" + FEED_URL_VIEW + "'>settings</a></div>"        
-                    
+            latestMessageVal = ""
+            if results:
+                latestMessageVal = results[0][0].dateReceived
             this_data = {
-                         "results"      :   results
-                        ,"feedTitle"    :   FEED_TITLE
+                         "feedTitle"    :   FEED_TITLE
                         ,"feedUrl"      :   FEED_URL
-                        ,"feedFooter"   :   footer
                         ,"updated"      :   latestMessageVal
-                        ,"name"         :   email_name
-                        ,"email"        :   USER_EMAIL
-                        ,"userlink"     :   USER_LINK  
-                        }     
-            app = App()
-            view_data = app.data(this_data)      
-           
-            
-            self.response.headers['Content-Type'] = 'application/atom+xml'
-            self.response.out.write(template.render("views/view/atom.xml", view_data))
-        else:
-            self.redirect("/#")
\ No newline at end of file
+                        ,"name"         :   FEED_TITLE
+                        ,"email"        :   emails[0]
+                        }
+            view_data = App().data(this_data)
+            parts = [Fragments.text(Templates.render('view/atom-head.xml', view_data))]
+            for msg, index in results:
+                parts.append(feed_entry("atom", msg, feed_urls[index], summaries[index]))
+            parts.append(u"\n</feed>")
+            document = u"".join(parts)
+        FeedCache.put(cache_key, format, feed_version, document)
+        Compression.write(self, document, (cache_key, format, feed_version))
@@ -0,0 +1,14 @@
+from google.appengine.ext import webapp
+from util import Hub
+
+class Subscribe(webapp.RequestHandler): #WebSub subscription requests, see util/Hub.py
+    def post(self):
+        error = Hub.request(self.request.get('hub.mode'), self.request.get('hub.topic'),
+                            self.request.get('hub.callback'), self.request.get('hub.lease_seconds'),
+                            self.request.get('hub.secret'))
+        self.response.headers['Content-Type'] = 'text/plain'
+        if error:
+            self.response.set_status(400)
+            self.response.out.write(error)
+        else: #verified with the callback from a task
+            self.response.set_status(202)
@@ -1,7 +1,40 @@
 from google.appengine.ext import webapp
+from util import Accounts, Blobs, Compression, Dedup, FeedCache, FeedStats, Hub, Instrument, Retention, Routes
 
 class NotFound(webapp.RequestHandler):
     def get(self):
         self.error(404)        
         self.response.out.write("not found")
-        
\ No newline at end of file
+        
+class Stats(webapp.RequestHandler): #admin only, see app.yaml
+    def get(self):
+        self.response.headers['Content-Type'] = 'text/plain'
+        if self.request.get('feed'): #one feed's totals, ?feed=<feed url>
+            for name, value in sorted(FeedStats.get(self.request.get('feed')).items()):
+                self.response.out.write("feed.%s %s\n" % (name, value))
+            return
+        for name, value in sorted(FeedCache.stats().items()):
+            self.response.out.write("feedcache.%s %s\n" % (name, value))
+        for name, value in sorted(Compression.stats.items()):
+            self.response.out.write("compression.%s %s\n" % (name, value))
+        for name, value in sorted(Accounts.stats.items()):
+            self.response.out.write("accounts.%s %s\n" % (name, value))
+        for name, value in sorted(Blobs.stats.items()):
+            self.response.out.write("blobs.%s %s\n" % (name, value))
+        for name, value in sorted(Dedup.stats.items()):
+            self.response.out.write("dedup.%s %s\n" % (name, value))
+        self.response.out.write("dedup.hit_rate %.3f\n" % (float(Dedup.stats['duplicates']) / max(Dedup.stats['checked'], 1)))
+        for name, value in sorted(Hub.stats().items()):
+            self.response.out.write("hub.%s %s\n" % (name, value))
+        for name, value in sorted(Retention.stats().items()):
+            self.response.out.write("retention.%s %s\n" % (name, value))
+        for name, seconds in sorted(Routes.loaded.items()): #handler modules imported by this instance, in ms
+            self.response.out.write("import.%s %.1f\n" % (name, seconds * 1000))
+        #request percentiles over this instance's recent samples: p50 p90 p99, times in ms
+        for handler, fields in sorted(Instrument.percentiles().items()):
+            self.response.out.write("\n%s (%d samples)\n" % (handler, Instrument.sampled[handler]))
+            for field in Instrument.FIELDS:
+                if field in ('calls', 'bytes'):
+                    self.response.out.write("  %-9s %d %d %d\n" % ((field,) + fields[field]))
+                else:
+                    self.response.out.write("  %-9s %.1f %.1f %.1f\n" % ((field,) + tuple([value * 1000 for value in fields[field]])))
@@ -1,18 +1,16 @@
 from google.appengine.ext import webapp
-from google.appengine.ext.webapp import template
 from google.appengine.api import users
-from urlparse import urlparse
 from models.models import UserDetails
-from google.appengine.ext import db
-import os, sys, main, config, re, math, time, random, logging, datetime
+import config, re, random
 from Base import App
+from util import Accounts, Templates
  
 class Check(webapp.RequestHandler):
     def get(self):
         self.redirect("/#")
     def post(self):               
         app = App() 
-        confirm_username = self.request.get('email_name')
+        user = Accounts.current()[0] #the owner of the new feed when logged in, see /account/feeds
         validator = AccountValidator()
         validation = validator.validate(self.request.get('email_name'))
         if validation['valid']:
@@ -25,19 +23,15 @@ class Check(webapp.RequestHandler):
             feed_view = feed_urls['view']
             feed_gen = feed_urls['gen']
                     
-            validator = AccountValidator() 
-            validation = validator.validate(confirm_username)       
-            if validation['valid']:  
-                userDetails = UserDetails()                
-                userDetails.emailName = validation['email_name']
-                userDetails.feedUrl = feed_gen     
-                userDetails.put()
-                
-                self.redirect("/view/" + feed_gen)
-            else:
-                self.redirect("/#invalid" + validation['errors'] + " " + confirm_username)            
-                    
-                    
+            userDetails = UserDetails()                
+            if user:
+                userDetails.accountName = user
+            userDetails.emailName = validation['email_name']
+            userDetails.feedUrl = feed_gen     
+            userDetails.put()
+            Accounts.add(userDetails)
+            
+            self.redirect("/view/" + feed_gen)
                     
                           
             this_data = {
@@ -50,13 +44,11 @@ class Check(webapp.RequestHandler):
                          }            
             view_data = app.data(this_data)     
             
-            path = os.path.join(main.ROOT_DIR, 'views/register.html')           
-            self.response.out.write(template.render(path,view_data))
+            self.response.out.write(Templates.render('register.html', view_data))
         else:
-            path = os.path.join(main.ROOT_DIR, 'views/index.html')
             this_data = {'errors':validation['errors']}        
             view_data = app.data(this_data)            
-            self.response.out.write(template.render(path, view_data))             
+            self.response.out.write(Templates.render('index.html', view_data))             
             #self.redirect("/#invalid-" + str(validation['errors']))     
                 
                 
@@ -101,8 +93,7 @@ class AccountValidator():
     
         
         #Is this email taken?
-        existingEmails = UserDetails.gql("WHERE emailName = :1 LIMIT 1",email_name)
-        for existingEmail in existingEmails:        
+        if Accounts.by_email_name(email_name):
             email_exists = True;          
         
         for unavailablename in unavailable_names:
@@ -0,0 +1,251 @@
+from google.appengine.ext import webapp
+from google.appengine.ext import db
+from google.appengine.api import users
+from models.models import HubSubscription, MailBlob, MailMessage, UserDetails
+from util import Accounts, Blobs, FeedStats, Fragments, Hub, Ingest, Retention, Search
+from Feed import CONTENT_TYPES, feed_document
+import datetime, logging, time
+try:
+    from google.appengine.api import taskqueue
+except ImportError:
+    from google.appengine.api.labs import taskqueue
+
+BATCH_SIZE = 100
+TASK_DEADLINE = 20 #seconds of work per task before chaining the next one
+
+class BatchTask(webapp.RequestHandler): #admin/task queue only, see app.yaml
+    """Walks every MailMessage in task queue batches chained by cursor
+
+    Subclasses implement process(messages). A GET starts the walk.
+    """
+    def get(self):
+        taskqueue.add(url=self.request.path)
+        self.response.headers['Content-Type'] = 'text/plain'
+        self.response.out.write("started")
+
+    def post(self): #one batch, then chain the next one from the cursor
+        query = MailMessage.all()
+        cursor = self.request.get('cursor')
+        if cursor:
+            query.with_cursor(cursor)
+        messages = query.fetch(BATCH_SIZE)
+        self.process(messages)
+        if len(messages) == BATCH_SIZE:
+            taskqueue.add(url=self.request.path, params={'cursor': query.cursor()})
+
+class BackfillFragments(BatchTask): #renders feed fragments and excerpts for messages stored before ingest did
+    def process(self, messages):
+        MailMessage.load_content(messages, True)
+        feed_urls = {}
+        updated = []
+        for message in messages:
+            if message.rssItem and message.atomEntry and message.summary is not None:
+                continue
+            email_name = message.toAddress.split("@")[0]
+            if email_name not in feed_urls:
+                feed_urls[email_name] = None
+                existingUser = Accounts.by_email_name(email_name)
+                if existingUser:
+                    feed_urls[email_name] = existingUser.feedUrl
+            if feed_urls[email_name]:
+                Fragments.render(message, feed_urls[email_name])
+                updated.append(message)
+        save(updated)
+        logging.info("Backfilled fragments for %d of %d messages" % (len(updated), len(messages)))
+
+class MigrateBodies(BatchTask): #moves inline bodies into compressed MailBody entities
+    def process(self, messages):
+        legacy = [message for message in messages if message.inlineBody is not None]
+        MailMessage.load_content(legacy, True)
+        for message in legacy:
+            body = message.inlineBody
+            message.body = body
+            message.size = len(body)
+        save(legacy)
+        logging.info("Moved bodies of %d of %d messages" % (len(legacy), len(messages)))
+
+class IndexMessages(BatchTask): #adds messages stored before search existed to the index
+    def process(self, messages):
+        MailMessage.load_content(messages)
+        feed_urls = {}
+        deliveries = []
+        for message in messages:
+            email_name = message.toAddress.split("@")[0]
+            if email_name not in feed_urls:
+                existingUser = Accounts.by_email_name(email_name)
+                feed_urls[email_name] = existingUser and existingUser.feedUrl
+            if feed_urls[email_name]:
+                deliveries.append((feed_urls[email_name], message))
+        Search.index(deliveries)
+        logging.info("Indexed %d of %d messages" % (len(deliveries), len(messages)))
+
+def save(messages):
+    #bodies first, so a failure in between never leaves a message without its body
+    db.put([message.content() for message in messages])
+    db.put(messages)
+
+class DrainIngest(webapp.RequestHandler): #task queue only, see util/Ingest.py
+    def post(self):
+        stored, finished = Ingest.drain()
+        logging.info("Ingested %d messages" % stored)
+        if not finished: #out of time with messages left, hand over right away
+            Ingest.schedule_worker(0)
+
+class AccountWalk():
+    """The accounts a chained task works through: first the one the previous
+    task stopped in the middle of ('account'), then the rest from the
+    'accounts' cursor.
+    """
+    def __init__(self, request):
+        self.query = UserDetails.all()
+        self.start = request.get('accounts')
+        if self.start:
+            self.query.with_cursor(self.start)
+        self.resume = request.get('account')
+        self.fetched = False
+
+    def next(self):
+        """(account, resumed) for the next account, (None, False) after the last one"""
+        while self.resume:
+            account = UserDetails.get(self.resume)
+            self.resume = None
+            if account is not None:
+                return account, True
+        batch = self.query.fetch(1)
+        self.fetched = True
+        if not batch:
+            return None, False
+        return batch[0], False
+
+    def cursor(self):
+        """Where the next task goes on; the query has no cursor of its own until it ran"""
+        if self.fetched:
+            return self.query.cursor()
+        return self.start
+
+class Compact(webapp.RequestHandler): #cron and task queue only, see cron.yaml
+    """Applies the retention policies to every account, chaining tasks as time runs out"""
+    def get(self): #cron starts a run
+        Retention.start()
+        taskqueue.add(url=self.request.path)
+        self.response.headers['Content-Type'] = 'text/plain'
+        self.response.out.write("started")
+
+    def post(self):
+        started = time.time()
+        deadline = started + TASK_DEADLINE
+        accounts = AccountWalk(self.request)
+        cursor = self.request.get('cursor') or None
+        seen = int(self.request.get('seen') or 0)
+        kept = int(self.request.get('kept') or 0)
+
+        scanned = deleted = 0
+        while time.time() < deadline:
+            account, resumed = accounts.next()
+            if account is None:
+                break
+            if not resumed:
+                cursor, seen, kept = None, 0, 0
+            before = seen
+            cursor, seen, kept, removed, finished = Retention.compact(account, deadline, cursor, seen, kept)
+            scanned += seen - before
+            deleted += removed
+            if not finished:
+                taskqueue.add(url=self.request.path, params={'accounts': accounts.cursor(),
+                    'account': str(account.key()), 'cursor': cursor, 'seen': seen, 'kept': kept})
+                break
+        else:
+            taskqueue.add(url=self.request.path, params={'accounts': accounts.cursor()})
+        Retention.record(scanned, deleted, time.time() - started)
+
+class RecountFeeds(webapp.RequestHandler): #admin/task queue only, see app.yaml
+    """Rebuilds every feed's totals (util/FeedStats.py) from its messages
+
+    Run once for feeds that had mail before the totals were kept at ingest.
+    """
+    def get(self):
+        taskqueue.add(url=self.request.path)
+        self.response.headers['Content-Type'] = 'text/plain'
+        self.response.out.write("started")
+
+    def post(self):
+        deadline = time.time() + TASK_DEADLINE
+        accounts = AccountWalk(self.request)
+        cursor = self.request.get('cursor') or None
+        messages = int(self.request.get('messages') or 0)
+        size = int(self.request.get('bytes') or 0)
+        latest_id = self.request.get('latest_id') and int(self.request.get('latest_id')) or None
+
+        while time.time() < deadline:
+            account, resumed = accounts.next()
+            if account is None:
+                return
+            if not resumed:
+                cursor, messages, size, latest_id = None, 0, 0, None
+            cursor, messages, size, latest_id, finished = FeedStats.recount(account, deadline, cursor, messages, size, latest_id)
+            if not finished:
+                taskqueue.add(url=self.request.path, params={'accounts': accounts.cursor(),
+                    'account': str(account.key()), 'cursor': cursor, 'messages': messages,
+                    'bytes': size, 'latest_id': latest_id or ''})
+                return
+        taskqueue.add(url=self.request.path, params={'accounts': accounts.cursor()})
+
+class AssignOwner(webapp.RequestHandler): #admin only, see app.yaml
+    """POST feed=<feed url>&owner=<email>: gives a feed registered without an owner to a user"""
+    def post(self):
+        self.response.headers['Content-Type'] = 'text/plain'
+        account = Accounts.by_feed_url(self.request.get('feed'))
+        owner = self.request.get('owner').strip()
+        if account is None or not owner:
+            self.response.set_status(404)
+            self.response.out.write("no such feed")
+            return
+        account = Accounts.assign_owner(account, users.User(owner))
+        self.response.out.write("%s is owned by %s" % (account.feedUrl, account.accountName.email()))
+
+class SweepBlobs(webapp.RequestHandler): #cron and task queue only, see cron.yaml
+    """Deletes the blobs no message links to that retention left behind,
+    because the query for their messages still saw ones it had just deleted
+    """
+    def get(self):
+        taskqueue.add(url=self.request.path)
+        self.response.headers['Content-Type'] = 'text/plain'
+        self.response.out.write("started")
+
+    def post(self):
+        query = MailBlob.all(keys_only=True)
+        cursor = self.request.get('cursor')
+        if cursor:
+            query.with_cursor(cursor)
+        keys = query.fetch(BATCH_SIZE)
+        Blobs.release([key.name() for key in keys])
+        if len(keys) == BATCH_SIZE:
+            taskqueue.add(url=self.request.path, params={'cursor': query.cursor()})
+
+class HubVerify(webapp.RequestHandler): #task queue only, see util/Hub.py
+    def post(self):
+        request = self.request
+        Hub.verify(request.get('mode'), request.get('topic'), request.get('callback'),
+                   request.get('lease_seconds'), request.get('secret'))
+
+class HubFanout(webapp.RequestHandler): #task queue only
+    def post(self):
+        cursor = Hub.fanout(self.request.get('feed'), self.request.get('cursor') or None)
+        if cursor:
+            taskqueue.Queue(Hub.QUEUE).add(taskqueue.Task(url=self.request.path,
+                params={'feed': self.request.get('feed'), 'cursor': cursor}))
+
+class HubDeliver(webapp.RequestHandler): #task queue only
+    def post(self):
+        subscription = HubSubscription.get_by_key_name(self.request.get('subscription'))
+        if subscription is None or subscription.leaseExpires < datetime.datetime.now():
+            return
+        document = feed_document(subscription.feedUrl, subscription.format)
+        if document is None:
+            return
+        if not Hub.deliver(subscription, document, CONTENT_TYPES[subscription.format]):
+            self.error(500) #retried with the hub queue's backoff
+
+class SearchMerge(webapp.RequestHandler): #task queue only, see util/Search.py
+    def post(self):
+        Search.merge(self.request.get('term'))
@@ -6,7 +6,7 @@ __author__ = "Andrew Dalke <dalke@dalkescientific.com>"
 
 _generator_name = __name__ + "-" + ".".join(map(str, __version__))
 
-import datetime
+import datetime, re
 
 # Could make this the base class; will need to add 'publish'
 class WriteXmlMixin:
@@ -26,6 +26,89 @@ class WriteXmlMixin:
         self.write_xml(f, encoding)
         return f.getvalue()
 
+    def iter_xml(self, encoding = "iso-8859-1"):
+        """Yields the same bytes as to_xml, in encoded chunks.
+
+        Containers which know how to publish incrementally (RSS2) yield
+        one chunk per item instead of building the whole document.
+        """
+        handler = StreamHandler(encoding)
+        handler.startDocument()
+        self.publish(handler)
+        yield handler.flush()
+
+
+_escape_search = re.compile(u"[&<>]").search
+_quoteattr_search = re.compile(u"[&<>\n\r\t]").search
+
+def _escape(data):
+    # same rules as saxutils.escape; most text has nothing to escape
+    if _escape_search(data) is None:
+        return data
+    return data.replace(u"&", u"&amp;").replace(u">", u"&gt;").replace(u"<", u"&lt;")
+
+class StreamHandler:
+    """A minimal stand-in for saxutils.XMLGenerator
+
+    Implements the handler calls used by the 'publish' API and
+    produces byte-identical output, but buffers it until flush() so
+    callers can stream a document out in pieces.
+    """
+    def __init__(self, encoding = "iso-8859-1"):
+        self._encoding = encoding
+        self._parts = []
+        self._write = self._parts.append
+
+    def startDocument(self):
+        self._write(u'<?xml version="1.0" encoding="%s"?>\n' % self._encoding)
+
+    def endDocument(self):
+        pass
+
+    def startElement(self, name, attrs):
+        write = self._write
+        write(u'<' + name)
+        for (name, value) in attrs.items():
+            write(u' %s=%s' % (name, _quoteattr(value)))
+        write(u'>')
+
+    def endElement(self, name):
+        self._write(u'</%s>' % name)
+
+    def characters(self, content):
+        if not isinstance(content, unicode):
+            content = unicode(content, self._encoding)
+        self._write(_escape(content))
+
+    def raw(self, content):
+        """Writes markup which is already escaped (see RawXml)"""
+        if not isinstance(content, unicode):
+            content = unicode(content, self._encoding)
+        self._write(content)
+
+    def text(self):
+        """Returns everything written since the last flush, as unicode"""
+        data = u"".join(self._parts)
+        del self._parts[:]
+        return data
+
+    def flush(self):
+        """Returns everything written since the last flush, encoded"""
+        return self.text().encode(self._encoding, "xmlcharrefreplace")
+
+def _quoteattr(data):
+    # same rules as saxutils.quoteattr
+    if _quoteattr_search(data) is not None:
+        data = _escape(data).replace(u"\n", u"&#10;").replace(u"\r", u"&#13;").replace(u"\t", u"&#9;")
+    if '"' in data:
+        if "'" in data:
+            data = '"%s"' % data.replace('"', "&quot;")
+        else:
+            data = "'%s'" % data
+    else:
+        data = '"%s"' % data
+    return data
+
 
 def _element(handler, name, obj, d = {}):
     if isinstance(obj, basestring) or obj is None:
@@ -249,6 +332,17 @@ class SkipDays:
                 _element(handler, "day", day)
             handler.endElement("skipDays")
 
+class RawXml:
+    """Publish a pre-rendered fragment, e.g. an <item> saved earlier
+
+    Only works with a StreamHandler (iter_xml); XMLGenerator has no
+    way to write unescaped markup.
+    """
+    def __init__(self, xml):
+        self.xml = xml
+    def publish(self, handler):
+        handler.raw(self.xml)
+
 class RSS2(WriteXmlMixin):
     """The main RSS class.
 
@@ -313,6 +407,24 @@ class RSS2(WriteXmlMixin):
         self.items = items
 
     def publish(self, handler):
+        self.publish_head(handler)
+        for item in self.items:
+            item.publish(handler)
+        self.publish_tail(handler)
+
+    def iter_xml(self, encoding = "iso-8859-1"):
+        handler = StreamHandler(encoding)
+        handler.startDocument()
+        self.publish_head(handler)
+        yield handler.flush()
+        for item in self.items:
+            item.publish(handler)
+            yield handler.flush()
+        self.publish_tail(handler)
+        yield handler.flush()
+
+    def publish_head(self, handler):
+        # Everything up to the first item
         handler.startElement("rss", self.rss_attrs)
         handler.startElement("channel", self.element_attrs)
         _element(handler, "title", self.title)
@@ -363,9 +475,7 @@ class RSS2(WriteXmlMixin):
         if self.skipDays is not None:
             self.skipDays.publish(handler)
 
-        for item in self.items:
-            item.publish(handler)
-
+    def publish_tail(self, handler):
         handler.endElement("channel")
         handler.endElement("rss")
 
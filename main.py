@@ -1,27 +1,48 @@
 from google.appengine.ext import webapp
 from google.appengine.ext.webapp.util import run_wsgi_app
-from google.appengine.ext.webapp.mail_handlers import InboundMailHandler 
-from util.MailHandler import MailHandler
-import logging, email, os
-import controllers.Misc
-import controllers.Feed
-import controllers.Home
-import controllers.Register
+from util import Accounts, Instrument, Routes
 
-ROOT_DIR = os.path.dirname(__file__)
-
-application = webapp.WSGIApplication([
-                                      MailHandler.mapping() #Used for email post mapping 
-                                    ,(r'/view/(.*)/(.*)', controllers.Feed.ShowMessage) #show feed message  
-                                    ,(r'/view/(.*)', controllers.Feed.ShowAll) #user web feed                                    
-                                    ,(r'/rss/(.*)', controllers.Feed.ShowRSS) #user RSS feed
-                                    ,('/',controllers.Home.Index) #Home page 
-                                    ,('/help', controllers.Home.Help) #Help page                                    
-                                    ,('/register', controllers.Register.Check) #Registration page                                  
-                                    ,(r'/(.*)', controllers.Feed.ShowAtom) #user Atom Feed 
-                                      ],
+#handlers are imported on their first request, see util/Routes.py
+webapp_application = webapp.WSGIApplication(Routes.mapping([
+                                      (r'/_ah/mail/.+', 'util.MailHandler.MailHandler') #Used for email post mapping 
+                                    ,(r'/view/([^/]*)/search', 'controllers.Feed.SearchFeed') #search a web feed
+                                    ,(r'/view/(.*)/(.*)', 'controllers.Feed.ShowMessage') #show feed message  
+                                    ,(r'/view/(.*)', 'controllers.Feed.ShowAll') #user web feed                                    
+                                    ,(r'/rss/(.*)', 'controllers.Feed.ShowRSS') #user RSS feed
+                                    ,('/', 'controllers.Home.Index') #Home page 
+                                    ,('/help', 'controllers.Home.Help') #Help page                                    
+                                    ,('/register', 'controllers.Register.Check') #Registration page                                  
+                                    ,(r'/combined/(rss|atom)/(.*)', 'controllers.Feed.ShowCombined') #several feeds of an account as one feed
+                                    ,('/hub', 'controllers.Hub.Subscribe') #WebSub subscriptions
+                                    ,(r'/blob/([0-9a-f]{40})', 'controllers.Blob.Show') #Images and attachments of messages
+                                    ,('/account/feeds', 'controllers.Account.Feeds') #All of the user's feeds and their newest entries, as JSON
+                                    ,('/account/opml', 'controllers.Account.Opml') #All of the user's feeds as OPML
+                                    ,('/stats', 'controllers.Misc.Stats') #Cache and request stats (admin)
+                                    ,('/tasks/backfill-fragments', 'controllers.Tasks.BackfillFragments') #Pre-render feed fragments (admin)
+                                    ,('/tasks/ingest', 'controllers.Tasks.DrainIngest') #Store queued mail in batches (task queue)
+                                    ,('/tasks/migrate-bodies', 'controllers.Tasks.MigrateBodies') #Move bodies out of MailMessage (admin)
+                                    ,('/tasks/compact', 'controllers.Tasks.Compact') #Apply retention policies (cron)
+                                    ,('/tasks/recount-feeds', 'controllers.Tasks.RecountFeeds') #Rebuild per-feed totals (admin)
+                                    ,('/tasks/assign-owner', 'controllers.Tasks.AssignOwner') #Give an ownerless feed to a user (admin)
+                                    ,('/tasks/sweep-blobs', 'controllers.Tasks.SweepBlobs') #Delete blobs no message links to (cron)
+                                    ,('/tasks/index-messages', 'controllers.Tasks.IndexMessages') #Add stored messages to search (admin)
+                                    ,('/tasks/search-merge', 'controllers.Tasks.SearchMerge') #Merge a term's posting segments (task queue)
+                                    ,('/tasks/hub/verify', 'controllers.Tasks.HubVerify') #Confirm WebSub (un)subscriptions (task queue)
+                                    ,('/tasks/hub/fanout', 'controllers.Tasks.HubFanout') #Queue a delivery per subscriber (task queue)
+                                    ,('/tasks/hub/deliver', 'controllers.Tasks.HubDeliver') #Push a feed to a subscriber (task queue)
+                                    ,(r'/(.*)', 'controllers.Feed.ShowAtom') #user Atom Feed 
+                                      ]),
                                      debug=True)
 
+Instrument.install(webapp_application)
+
+def application(environ, start_response):
+    Accounts.start_request()
+    try:
+        return Instrument.call(webapp_application, environ, start_response)
+    finally:
+        Accounts.end_request(environ.get('PATH_INFO'))
+
 def main():
     run_wsgi_app(application)
 
@@ -1,13 +1,128 @@
 from google.appengine.ext import db
-import config
+import config, zlib
 
 class MailMessage(db.Model):
+    """Message summary, cheap to list.
+
+    The body and the pre-rendered feed fragments (see util/Fragments.py) live
+    zlib compressed in a MailBody with the same id. It is fetched the first
+    time .body, .rssItem or .atomEntry is read; load_content() fetches it for a
+    whole page of messages in one call.
+    """
     toAddress = db.StringProperty()
     fromAddress = db.StringProperty()
     subject = db.StringProperty(multiline=True)
-    body = db.TextProperty() 
     dateSent = db.StringProperty()
     dateReceived = db.DateTimeProperty()
+    size = db.IntegerProperty() #body length, uncompressed
+    summary = db.TextProperty() #plain text start of the body for summary feeds, see util/Fragments.py
+    blobs = db.StringListProperty() #sha1 of the MailBlobs the body links to, see util/Blobs.py
+    #stored on the message itself before MailBody, moved by /tasks/migrate-bodies
+    inlineBody = db.TextProperty(name='body')
+
+    def content(self):
+        """The MailBody for this message, new and unsaved if there is none yet"""
+        if getattr(self, '_content', None) is None:
+            content = None
+            if self.is_saved():
+                content = MailBody.get_by_id(self.key().id())
+            self._content = content or MailBody(key=MailBody.key_for(self))
+        return self._content
+
+    @staticmethod
+    def load_content(messages, inline_too=False):
+        """Fetches the MailBody of every message that needs one in one batch get
+
+        Messages with an inline body are skipped unless inline_too is set.
+        """
+        needed = [message for message in messages if getattr(message, '_content', None) is None
+                  and (inline_too or message.inlineBody is None)]
+        if needed:
+            contents = db.get([MailBody.key_for(message) for message in needed])
+            for message, content in zip(needed, contents):
+                message._content = content or MailBody(key=MailBody.key_for(message))
+
+    def _get_body(self):
+        if self.inlineBody is not None:
+            return self.inlineBody
+        return self.content().body
+    def _set_body(self, value):
+        self.inlineBody = None
+        self.content().body = value
+    body = property(_get_body, _set_body)
+
+    def _get_rss_item(self):
+        return self.content().rssItem
+    def _set_rss_item(self, value):
+        self.content().rssItem = value
+    rssItem = property(_get_rss_item, _set_rss_item)
+
+    def _get_atom_entry(self):
+        return self.content().atomEntry
+    def _set_atom_entry(self, value):
+        self.content().atomEntry = value
+    atomEntry = property(_get_atom_entry, _set_atom_entry)
+
+def _compressed(name):
+    def get(self):
+        data = getattr(self, name)
+        if data is None:
+            return None
+        return zlib.decompress(data).decode('utf-8')
+    def set(self, value):
+        if value is None:
+            setattr(self, name, None)
+        else:
+            setattr(self, name, db.Blob(zlib.compress(value.encode('utf-8'))))
+    return property(get, set)
+
+class MailBody(db.Model):
+    """Body and feed fragments of the MailMessage with the same id, zlib compressed"""
+    bodyData = db.BlobProperty()
+    rssItemData = db.BlobProperty()
+    atomEntryData = db.BlobProperty()
+
+    body = _compressed('bodyData')
+    rssItem = _compressed('rssItemData')
+    atomEntry = _compressed('atomEntryData')
+
+    @staticmethod
+    def key_for(message):
+        return db.Key.from_path('MailBody', message.key().id())
+
+class MailBlob(db.Model):
+    """An image or attachment taken out of a message body, key name the sha1 of its data, see util/Blobs.py"""
+    data = db.BlobProperty()
+    contentType = db.StringProperty()
+    size = db.IntegerProperty()
+    created = db.DateTimeProperty(auto_now_add=True)
+
+class FeedCounterShard(db.Model):
+    """One shard of a feed's totals, key name "<feedUrl>:<n>", see util/FeedStats.py"""
+    messages = db.IntegerProperty(default=0)
+    bytes = db.IntegerProperty(default=0)
+    latestReceived = db.DateTimeProperty()
+    latestId = db.IntegerProperty()
+
+class FeedCounted(db.Model):
+    """Marks a message as counted by the FeedCounterShard it is a child of, key id the message's; see util/FeedStats.py"""
+    pass
+
+class SearchPostings(db.Model):
+    """Ids of a feed's messages containing a term, with the term's weight in each; see util/Search.py"""
+    term = db.StringProperty() #"<feedUrl> <term>"
+    ids = db.ListProperty(long, indexed=False)
+    weights = db.ListProperty(long, indexed=False)
+
+class HubSubscription(db.Model):
+    """A WebSub subscriber of one of our feeds, key name from util/Hub.py"""
+    topic = db.StringProperty()
+    feedUrl = db.StringProperty()
+    format = db.StringProperty() #rss or atom
+    callback = db.StringProperty()
+    secret = db.StringProperty()
+    leaseExpires = db.DateTimeProperty()
+    created = db.DateTimeProperty(auto_now_add=True)
 
 class UserDetails(db.Model):
     accountName = db.UserProperty() 
@@ -15,6 +130,11 @@ class UserDetails(db.Model):
     feedUrl = db.StringProperty(multiline=False)
     date = db.DateTimeProperty(auto_now_add=True)    
     trustedMode = db.BooleanProperty(default=config.SETTINGS['trustedmode'])
+    #retention overrides, None falls back to the RETAIN_* settings
+    retainMessages = db.IntegerProperty()
+    retainDays = db.IntegerProperty()
+    retainBytes = db.IntegerProperty()
+    summaryMode = db.BooleanProperty(default=False) #feeds carry excerpts unless a reader asks for ?mode=full
     
 class TrustedEmails(db.Model):
     accountName = db.UserProperty()
@@ -0,0 +1,125 @@
+from google.appengine.api import users
+from google.appengine.ext import db
+from models.models import UserDetails
+from util.LRUCache import LRUCache
+import config, logging
+
+# One place to resolve an account (UserDetails) by feed url, email name or
+# logged-in user. Every account loaded is indexed under all three keys, so a
+# request that needs the same account twice, or a later request on this
+# instance, doesn't go back to the datastore.
+#
+# Only the logged-in user lookup caches a negative answer: a missing feed or
+# email name may be registered on another instance at any moment, and mail
+# for it must not be dropped until the entry expires.
+
+_index = LRUCache(config.SETTINGS['accountcache_entries'], ttl=config.SETTINGS['accountcache_ttl'])
+_NOT_CACHED = object()
+
+stats = {'lookups': 0, 'queries': 0, 'max_request_queries': 0}
+request_queries = 0
+_current = None #(user, account) of this request, see current()
+
+def by_feed_url(feed_url):
+    return _lookup(('feedUrl', feed_url), "WHERE feedUrl = :1 LIMIT 1", feed_url)
+
+def by_email_name(email_name):
+    return _lookup(('emailName', email_name), "WHERE emailName = :1 LIMIT 1", email_name)
+
+def by_email_names(email_names):
+    """{email name: account} for the names that exist, one IN query per 30 uncached names"""
+    global request_queries
+    found = {}
+    missing = []
+    for email_name in email_names:
+        stats['lookups'] += 1
+        account = _index.get(('emailName', email_name), _NOT_CACHED)
+        if account is _NOT_CACHED:
+            missing.append(email_name)
+        elif account is not None:
+            found[email_name] = account
+    for start in range(0, len(missing), 30): #the datastore's IN limit
+        stats['queries'] += 1
+        request_queries += 1
+        for existingUser in UserDetails.gql("WHERE emailName IN :1", missing[start:start + 30]):
+            add(existingUser)
+            found[existingUser.emailName] = existingUser
+    return found
+
+def by_account(user):
+    return _lookup(('accountName', user.email()), "WHERE accountName = :1 LIMIT 1", user, True)
+
+def owned(user):
+    """Every account registered by a user, oldest first, with one query.
+
+    The accounts are indexed by feed url and email name for the lookups that
+    follow, but not by user: by_account() keeps answering with one account.
+    """
+    global request_queries
+    stats['lookups'] += 1
+    stats['queries'] += 1
+    request_queries += 1
+    accounts = UserDetails.gql("WHERE accountName = :1 ORDER BY date", user).fetch(config.SETTINGS['max_account_feeds'])
+    for account in accounts:
+        _index.put(('feedUrl', account.feedUrl), account, 1)
+        _index.put(('emailName', account.emailName), account, 1)
+    return accounts
+
+def assign_owner(account, user):
+    """Makes user the owner of an account that has none, in a transaction.
+
+    Returns the account as stored, whose owner is someone else if it had one.
+    """
+    def assign():
+        stored = UserDetails.get(account.key())
+        if stored.accountName is None:
+            stored.accountName = user
+            stored.put()
+        return stored
+    stored = db.run_in_transaction(assign)
+    add(stored)
+    return stored
+
+def current():
+    """(user, account) for the logged-in user, looked up once per request"""
+    global _current
+    if _current is None:
+        user = users.get_current_user()
+        _current = (user, user and by_account(user) or None)
+    return _current
+
+def add(account):
+    """Indexes a new or changed account under all of its keys"""
+    _index.put(('feedUrl', account.feedUrl), account, 1)
+    _index.put(('emailName', account.emailName), account, 1)
+    if account.accountName:
+        _index.put(('accountName', account.accountName.email()), account, 1)
+
+def start_request():
+    global request_queries, _current
+    request_queries = 0
+    _current = None
+
+def end_request(path):
+    if request_queries:
+        logging.debug("%d account queries for %s" % (request_queries, path))
+    if request_queries > stats['max_request_queries']:
+        stats['max_request_queries'] = request_queries
+
+def _lookup(key, where, value, cache_missing=False):
+    global request_queries
+    stats['lookups'] += 1
+    account = _index.get(key, _NOT_CACHED)
+    if account is not _NOT_CACHED:
+        return account
+
+    stats['queries'] += 1
+    request_queries += 1
+    account = None
+    for existingUser in UserDetails.gql(where, value):
+        account = existingUser
+    if account is not None:
+        add(account)
+    elif cache_missing:
+        _index.put(key, None, 1)
+    return account
@@ -0,0 +1,38 @@
+import re
+
+# Recipient parsing for inbound mail. Quoted display names are dropped
+# first, so a name like "Doe, Jane (jane@example.com)" can't produce a bogus
+# address; then every addr-spec is picked out with one compiled pattern.
+
+_QUOTED = re.compile(r'"(?:[^"\\]|\\.)*"')
+_ADDRESS = re.compile(r'<\s*([^<>\s@]+@[^<>\s]+?)\s*>|([^\s<>,;:()"\[\]@]+@[^\s<>,;:()"\[\]]+)')
+
+def parse(*headers):
+    """All addresses in the given header values, in order, without duplicates"""
+    addresses = []
+    seen = {}
+    for header in headers:
+        if not header:
+            continue
+        for bracketed, bare in _ADDRESS.findall(_QUOTED.sub(' ', header)):
+            address = bracketed or bare
+            key = address.lower()
+            if key not in seen:
+                seen[key] = True
+                addresses.append(address)
+    return addresses
+
+def route(envelope, *forwarded):
+    """The addresses a delivery is stored for: its envelope address, then the
+    ones forwarding rules name in X-Forwarded-To, whatever their domain
+    """
+    recipients = parse(envelope)
+    for address in parse(*forwarded):
+        if address not in recipients:
+            recipients.append(address)
+    return recipients
+
+def split(address):
+    """(email name, domain) of an address"""
+    name, domain = address.rsplit("@", 1)
+    return name, domain.lower()
@@ -0,0 +1,173 @@
+from google.appengine.api import memcache
+from google.appengine.ext import db
+from models.models import MailBlob, MailMessage
+from util import MimeBody
+from util.LRUCache import LRUCache
+import binascii, cgi, config, hashlib, logging, re, time, urllib
+
+# Images and attachments are taken out of message bodies as mail arrives
+# and stored once each, keyed by the sha1 of their data, in MailBlob. The
+# body links to /blob/<sha1> instead: data: URIs and cid: references in
+# HTML are rewritten, every other part is listed after the text. Bodies and
+# feeds stop carrying the bytes, and a logo sent with thousands of
+# newsletters is stored once. Blobs never change, so they are served with
+# immutable cache headers; memcache remembers which ones are stored, and
+# when they were last used, so a repeated logo costs no datastore call at all.
+#
+# Blobs are parsed out as mail arrives but only written by util/Ingest.py,
+# for the messages it actually stores. Each MailMessage lists the blobs its
+# body links to; when retention deletes messages, the blobs no remaining
+# message lists are deleted too (release).
+
+PREFIX = "blob:"
+SAFE_TYPES = frozenset(['image/png', 'image/gif', 'image/jpeg', 'image/pjpeg', 'image/webp', 'image/bmp',
+                        'image/x-icon']) #shown inline, everything else is served as a download
+_DATA_URI = re.compile(r'data:([\w.+-]+/[\w.+-]+);base64,([A-Za-z0-9+/=\s]+)', re.I)
+_CID = re.compile(r'''cid:([^"'\s)>]+)''', re.I)
+_SPACE = re.compile(r'\s+')
+_LINK = re.compile(r'/blob/([0-9a-f]{40})')
+RELEASE_GRACE = 3600 #seconds a blob that was just used is kept, while the index of its new messages catches up
+_cache = LRUCache(config.SETTINGS['blobcache_entries'], config.SETTINGS['blobcache_bytes'])
+
+stats = {'parts': 0, 'stored': 0, 'duplicates': 0, 'bytes_stored': 0, 'bytes_offloaded': 0, 'too_big': 0, 'served': 0,
+         'released': 0}
+
+def url(digest):
+    return config.SETTINGS['url'] + "/blob/" + digest
+
+def inline_data(text, blobs):
+    """Replaces the data: URIs in some HTML with blob urls, adding the data to blobs"""
+    def replace(match):
+        try:
+            data = binascii.a2b_base64(_SPACE.sub('', match.group(2)).encode('ascii'))
+        except binascii.Error:
+            return match.group(0)
+        if len(data) > config.SETTINGS['blob_max_bytes']:
+            return match.group(0)
+        return url(_add(blobs, match.group(1).lower(), data))
+    return _DATA_URI.sub(replace, text)
+
+def offload(body, message, blobs):
+    """Points the body of a message at its images and attachments, adding them to blobs.
+
+    body is what MimeBody.extract returned, with inline_data(text, blobs) as
+    its rewrite. Returns the new body; store() writes the blobs.
+    """
+    html = MimeBody.is_html(message)
+    by_cid = {}
+    others = []
+    for content_id, filename, content_type, size, data in MimeBody.parts(message, config.SETTINGS['blob_max_bytes']):
+        digest = None
+        if data is None:
+            stats['too_big'] += 1
+        else:
+            digest = _add(blobs, content_type, data)
+            if content_id:
+                by_cid[content_id] = digest
+        name = filename or content_type
+        if isinstance(name, str):
+            name = name.decode('utf-8', 'replace')
+        others.append((content_id, name, size, digest))
+
+    referenced = set()
+    def replace(match):
+        content_id = urllib.unquote(match.group(1))
+        if content_id not in by_cid:
+            return match.group(0)
+        referenced.add(content_id)
+        return url(by_cid[content_id])
+    if body and html:
+        body = _CID.sub(replace, body)
+
+    listed = [(name, size, digest) for content_id, name, size, digest in others if content_id not in referenced]
+    if listed:
+        if html or body is None:
+            links = []
+            for name, size, digest in listed:
+                name = cgi.escape(name, True)
+                if digest:
+                    links.append(u'<li><a href="%s">%s</a> (%s)</li>' % (url(digest), name, _size(size)))
+                else:
+                    links.append(u'<li>%s (%s, too big to keep)</li>' % (name, _size(size)))
+            body = (body or u"") + u'<ul class="attachments">%s</ul>' % u"".join(links)
+        else:
+            lines = [u"\n\nAttachments:"]
+            for name, size, digest in listed:
+                lines.append(u"%s (%s) %s" % (name, _size(size), digest and url(digest) or u"too big to keep"))
+            body = body + u"\n".join(lines)
+    return body
+
+def references(body):
+    """sha1 of the blobs a body links to, in order, without duplicates"""
+    found = []
+    for digest in _LINK.findall(body or ""):
+        if digest not in found:
+            found.append(digest)
+    return found
+
+def store(blobs):
+    """Writes the blobs ({sha1: (content type, data)}) that aren't stored yet"""
+    if not blobs:
+        return
+    known = memcache.get_multi(blobs.keys(), key_prefix=PREFIX)
+    missing = [digest for digest in blobs if digest not in known]
+    for start in range(0, len(missing), 30): #the datastore's IN limit
+        keys = [db.Key.from_path('MailBlob', digest) for digest in missing[start:start + 30]]
+        for key in db.Query(MailBlob, keys_only=True).filter('__key__ IN', keys):
+            known[key.name()] = True
+    new = [MailBlob(key_name=digest, data=db.Blob(blobs[digest][1]), contentType=blobs[digest][0],
+                    size=len(blobs[digest][1])) for digest in missing if digest not in known]
+    for blob in new:
+        db.put(blob) #one at a time, a batch could pass the 1MB call limit
+        stats['stored'] += 1
+        stats['bytes_stored'] += blob.size
+    stats['duplicates'] += len(blobs) - len(new)
+    memcache.set_multi(dict([(digest, int(time.time())) for digest in blobs]), key_prefix=PREFIX) #last used, see release()
+    if new:
+        logging.info("Stored %d of %d blobs" % (len(new), len(blobs)))
+
+def release(digests):
+    """Deletes the blobs of deleted messages that no other message links to.
+
+    A blob stored or reused within RELEASE_GRACE is kept: the query for the
+    messages listing it may not see the newest of them yet.
+    """
+    digests = list(set(digests))
+    if not digests:
+        return 0
+    used = memcache.get_multi(digests, key_prefix=PREFIX)
+    recent = time.time() - RELEASE_GRACE
+    unused = [digest for digest in digests if used.get(digest, 0) < recent and
+              MailMessage.all(keys_only=True).filter("blobs = ", digest).get() is None]
+    if unused:
+        db.delete([db.Key.from_path('MailBlob', digest) for digest in unused])
+        memcache.delete_multi(unused, key_prefix=PREFIX)
+        for digest in unused:
+            _cache.delete(digest)
+        stats['released'] += len(unused)
+        logging.info("Released %d of %d blobs" % (len(unused), len(digests)))
+    return len(unused)
+
+def get(digest):
+    """(content type, data) of a blob, or None when there is no such blob"""
+    stats['served'] += 1
+    cached = _cache.get(digest)
+    if cached is None:
+        blob = MailBlob.get_by_key_name(digest)
+        if blob is None:
+            return None
+        cached = (blob.contentType, blob.data)
+        _cache.put(digest, cached, len(blob.data))
+    return cached
+
+def _add(blobs, content_type, data):
+    digest = hashlib.sha1(data).hexdigest()
+    stats['parts'] += 1
+    stats['bytes_offloaded'] += len(data)
+    blobs.setdefault(digest, (content_type, data))
+    return digest
+
+def _size(size):
+    if size >= 1024 * 1024:
+        return u"%.1f MB" % (size / 1048576.0)
+    return u"%d KB" % max(1, size / 1024)
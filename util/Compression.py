@@ -0,0 +1,82 @@
+from util import FeedCache
+import config, zlib
+
+# gzip for feeds and pages, negotiated on Accept-Encoding. Feed documents
+# are compressed once per feed version: the gzip copy is kept in FeedCache
+# next to the plain one and dropped with it. Pages are per user and small,
+# so they are compressed as they are served.
+
+MIN_BYTES = 1024 #smaller bodies aren't worth the header and the CPU
+ETAG_SUFFIX = "-gz" #the gzip copy is another representation, with an ETag of its own
+
+stats = {'compressed': 0, 'cached': 0, 'plain': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+def accepts_gzip(request):
+    """True when the request's Accept-Encoding allows gzip"""
+    other = False
+    for coding in request.headers.get('Accept-Encoding', '').split(','):
+        parts = coding.split(';')
+        name = parts[0].strip().lower()
+        quality = 1.0
+        for parameter in parts[1:]:
+            parameter = parameter.strip()
+            if parameter.startswith('q='):
+                try:
+                    quality = float(parameter[2:])
+                except ValueError:
+                    quality = 0.0
+        if name in ('gzip', 'x-gzip'):
+            return quality > 0
+        if name == '*':
+            other = quality > 0
+    return other
+
+def gzip_etag(etag):
+    """The ETag of the gzip copy of a response whose (quoted) ETag is etag"""
+    return etag[:-1] + ETAG_SUFFIX + '"'
+
+def vary(handler):
+    """Marks a response as negotiated on Accept-Encoding, 200 and 304 alike"""
+    value = handler.response.headers.get('Vary')
+    if value and 'Accept-Encoding' in value:
+        return
+    handler.response.headers['Vary'] = value and value + ', Accept-Encoding' or 'Accept-Encoding'
+
+def gzip(body, level=None):
+    if level is None:
+        level = config.SETTINGS['compression_level']
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS) #gzip framing
+    return compressor.compress(body) + compressor.flush()
+
+def write(handler, body, cached=None):
+    """Writes a response body, gzipped if the client takes it.
+
+    cached is (cache key, format, version) for a document held in FeedCache,
+    whose gzip copy is then taken from or added to the cache.
+    """
+    if isinstance(body, unicode):
+        body = body.encode('utf-8') #what webapp would send
+    vary(handler)
+    level = config.SETTINGS['compression_level']
+    if not level or len(body) < MIN_BYTES or not accepts_gzip(handler.request):
+        stats['plain'] += 1
+        handler.response.out.write(body)
+        return
+    compressed = None
+    if cached:
+        key, format, version = cached
+        compressed = FeedCache.get(key, format + ":gzip", version)
+    if compressed is None:
+        compressed = gzip(body, level)
+        stats['compressed'] += 1
+        if cached:
+            FeedCache.put(key, format + ":gzip", version, compressed)
+    else:
+        stats['cached'] += 1
+    stats['bytes_in'] += len(body)
+    stats['bytes_out'] += len(compressed)
+    handler.response.headers['Content-Encoding'] = 'gzip'
+    etag = handler.response.headers.get('ETag')
+    if etag:
+        handler.response.headers['ETag'] = gzip_etag(etag)
+    handler.response.out.write(compressed)
@@ -0,0 +1,63 @@
+from google.appengine.api import memcache
+from util.LRUCache import LRUCache
+import config, hashlib, re
+
+# Drops copies of a message a feed already got: forwarding rules and list
+# retries deliver the same mail more than once, sometimes directly and again
+# through X-Forwarded-To. A copy is recognised by its Message-ID plus a hash
+# of the sender and the normalised subject and body, per feed. Mail without a
+# Message-ID is never dropped: identical automated alerts are separate
+# messages that only the Message-ID tells apart. Recent fingerprints are kept
+# in a bounded per-instance cache backed by memcache, so the check never
+# needs a datastore query; a fingerprint that has been evicted from both just
+# lets the copy through.
+
+PREFIX = "dedup:"
+_recent = LRUCache(config.SETTINGS['dedup_entries'], ttl=config.SETTINGS['dedup_window'])
+_SPACE = re.compile(r'\s+')
+
+stats = {'checked': 0, 'duplicates': 0}
+
+def fingerprint(pending):
+    """Hash of a parsed message (see MailHandler.receive), the same for every copy.
+
+    None for a message without a Message-ID, which is not deduplicated.
+    """
+    if not pending.get('messageId'):
+        return None
+    subject = _SPACE.sub(' ', pending.get('subject') or '').strip().lower()
+    body = _SPACE.sub(' ', pending.get('body') or '').strip()
+    digest = hashlib.sha1()
+    for part in (pending['messageId'], pending.get('sender') or '', subject, body):
+        if isinstance(part, unicode):
+            part = part.encode('utf-8')
+        digest.update(part)
+        digest.update('\0')
+    return digest.hexdigest()
+
+def unseen(deliveries):
+    """The (feed url, fingerprint) pairs no earlier or repeated delivery has, in order"""
+    stats['checked'] += len(deliveries)
+    keys = []
+    for delivery in deliveries:
+        if delivery not in keys and _recent.get(delivery) is None:
+            keys.append(delivery)
+    if keys:
+        shared = memcache.get_multi([_key(delivery) for delivery in keys], key_prefix=PREFIX)
+        for delivery in keys[:]:
+            if _key(delivery) in shared:
+                _recent.put(delivery, True, 1)
+                keys.remove(delivery)
+    stats['duplicates'] += len(deliveries) - len(keys)
+    return keys
+
+def remember(deliveries):
+    """Called once the deliveries are stored, so a failed write is retried rather than dropped"""
+    for delivery in deliveries:
+        _recent.put(delivery, True, 1)
+    memcache.set_multi(dict([(_key(delivery), 1) for delivery in deliveries]),
+                       time=config.SETTINGS['dedup_window'], key_prefix=PREFIX)
+
+def _key(delivery):
+    feed_url, digest = delivery
+    return hashlib.sha1(feed_url.encode('utf-8')).hexdigest()[:16] + digest
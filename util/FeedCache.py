@@ -0,0 +1,66 @@
+from google.appengine.api import memcache
+from util.LRUCache import LRUCache
+import config, time
+
+# Rendered RSS/Atom documents, keyed by (feed url, format). Each entry remembers
+# the feed version it was rendered from; the version lives in memcache so that a
+# message stored by any instance invalidates the copies held by every instance.
+_cache = LRUCache(config.SETTINGS['feedcache_entries'], config.SETTINGS['feedcache_bytes'])
+
+VERSION_PREFIX = "feedver:"
+MODIFIED_PREFIX = "feedmod:"
+FORMATS = ("rss", "atom")
+MODES = ("", ":summary") #whole bodies, and the excerpts of summary mode
+ENCODINGS = ("", ":gzip") #plain, and the copy util/Compression.py adds
+
+def version(feed_url):
+    return state(feed_url)[0]
+
+def state(feed_url):
+    """Returns (version, last modified) for a feed in a single memcache call.
+
+    Last modified is in seconds since the epoch, or None when it isn't known.
+    """
+    return states([feed_url])[0]
+
+def states(feed_urls):
+    """state() of several feeds, in order, still in a single memcache call"""
+    values = memcache.get_multi([VERSION_PREFIX + feed_url for feed_url in feed_urls] +
+                                [MODIFIED_PREFIX + feed_url for feed_url in feed_urls])
+    result = []
+    for feed_url in feed_urls:
+        key = VERSION_PREFIX + feed_url
+        current = values.get(key)
+        if current is None:
+            # unknown or evicted: start a fresh version so nothing cached earlier matches
+            current = int(time.time() * 1000)
+            if not memcache.add(key, current):
+                current = memcache.get(key) or current
+        result.append((current, values.get(MODIFIED_PREFIX + feed_url)))
+    return result
+
+def get(feed_url, format, feed_version=None):
+    if feed_version is None:
+        feed_version = version(feed_url)
+    entry = _cache.get((feed_url, format))
+    if entry and entry[0] == feed_version:
+        return entry[1]
+    return None
+
+def put(feed_url, format, feed_version, body):
+    _cache.put((feed_url, format), (feed_version, body), len(body))
+
+def invalidate(feed_url):
+    """Called when a feed changes. Bumps the shared version and drops local copies."""
+    key = VERSION_PREFIX + feed_url
+    now = time.time()
+    if memcache.incr(key) is None:
+        memcache.set(key, int(now * 1000))
+    memcache.set(MODIFIED_PREFIX + feed_url, int(now))
+    for format in FORMATS:
+        for mode in MODES:
+            for encoding in ENCODINGS:
+                _cache.delete((feed_url, format + mode + encoding))
+
+def stats():
+    return _cache.stats()
@@ -0,0 +1,131 @@
+from google.appengine.api import memcache
+from google.appengine.ext import db
+from models.models import FeedCounted, FeedCounterShard, MailMessage
+import config, random, time
+
+# Per-feed totals kept up to date as mail is stored and deleted: message
+# count, body bytes, and the newest message's dateReceived and id. Each
+# change goes to one shard in its own transaction, a random one or the one
+# a stored message's id picks, so ingest workers storing mail for the same
+# feed rarely write the same entity. Reading sums
+# the shards with one batch get and keeps the result in memcache until the
+# next change, or CACHE_SECONDS at most: a reader that summed the shards
+# just before a change can write its stale totals back after the change
+# dropped them.
+
+PREFIX = "feedstats:"
+BATCH_SIZE = 200
+CACHE_SECONDS = 60
+
+def get(feed_url):
+    """{'messages', 'bytes', 'latest', 'latest_id'} for a feed; latest is None while unknown"""
+    return get_multi([feed_url])[feed_url]
+
+def get_multi(feed_urls):
+    """{feed url: get(feed url)} with one memcache call, and one batch get for the feeds it misses"""
+    cached = memcache.get_multi(feed_urls, key_prefix=PREFIX)
+    missing = [feed_url for feed_url in feed_urls if feed_url not in cached]
+    if missing:
+        key_names = [_key_names(feed_url) for feed_url in missing]
+        shards = iter(FeedCounterShard.get_by_key_name(sum(key_names, [])))
+        counted = {}
+        for feed_url, names in zip(missing, key_names):
+            totals = counted[feed_url] = {'messages': 0, 'bytes': 0, 'latest': None, 'latest_id': None}
+            for shard in [shards.next() for name in names]:
+                if shard is None:
+                    continue
+                totals['messages'] += shard.messages
+                totals['bytes'] += shard.bytes
+                if shard.latestReceived and (totals['latest'] is None or shard.latestReceived > totals['latest']):
+                    totals['latest'] = shard.latestReceived
+                    totals['latest_id'] = shard.latestId
+        memcache.set_multi(counted, time=CACHE_SECONDS, key_prefix=PREFIX)
+        cached.update(counted)
+    return cached
+
+def add(feed_url, messages, bytes, latest=None, latest_id=None):
+    """Adds to a feed's totals, negative when deleting. latest only ever moves forward"""
+    key_name = random.choice(_key_names(feed_url))
+    def increment():
+        shard = FeedCounterShard.get_by_key_name(key_name) or FeedCounterShard(key_name=key_name)
+        shard.messages += messages
+        shard.bytes += bytes
+        if latest and (shard.latestReceived is None or latest > shard.latestReceived):
+            shard.latestReceived = latest
+            shard.latestId = latest_id
+        shard.put()
+    db.run_in_transaction(increment)
+    memcache.delete(PREFIX + feed_url)
+
+def add_messages(feed_url, messages):
+    """Counts newly stored messages into a feed's totals, each exactly once.
+
+    Ingest stores a retried batch again (see util/Ingest.py), so each message
+    goes to the shard its id picks and leaves a FeedCounted marker under it,
+    checked and written in the same transaction as the counts.
+    """
+    key_names = _key_names(feed_url)
+    by_shard = {}
+    for message in messages:
+        by_shard.setdefault(key_names[message.key().id() % len(key_names)], []).append(message)
+    for key_name, shard_messages in by_shard.items():
+        db.run_in_transaction(_count, key_name, shard_messages)
+    memcache.delete(PREFIX + feed_url)
+
+def counted_key(feed_url, message_id):
+    """Key of the marker add_messages left for a message, deleted with the message"""
+    key_names = _key_names(feed_url)
+    return db.Key.from_path('FeedCounterShard', key_names[message_id % len(key_names)], 'FeedCounted', message_id)
+
+def _count(key_name, messages):
+    shard_key = db.Key.from_path('FeedCounterShard', key_name)
+    markers = [db.Key.from_path('FeedCounted', message.key().id(), parent=shard_key) for message in messages]
+    found = db.get([shard_key] + markers)
+    new = [(message, marker) for message, marker, existing in zip(messages, markers, found[1:]) if existing is None]
+    if not new:
+        return
+    shard = found[0] or FeedCounterShard(key=shard_key)
+    for message, marker in new:
+        shard.messages += 1
+        shard.bytes += message.size or 0
+        if shard.latestReceived is None or message.dateReceived > shard.latestReceived:
+            shard.latestReceived = message.dateReceived
+            shard.latestId = message.key().id()
+    db.put([shard] + [FeedCounted(key=marker) for message, marker in new])
+
+def recount(account, deadline, cursor=None, messages=0, bytes=0, latest_id=None):
+    """Counts an account's messages from scratch, newest first, and replaces its totals.
+
+    For feeds that had mail before the counters existed. Stops at the deadline.
+    Returns (cursor, messages, bytes, latest_id, finished); pass the last four
+    back in to resume.
+    """
+    query = MailMessage.all().filter("toAddress = ", account.emailName + config.SETTINGS['emaildomain']).order("-dateReceived")
+    if cursor:
+        query.with_cursor(cursor)
+    while time.time() < deadline:
+        batch = query.fetch(BATCH_SIZE)
+        for message in batch:
+            if latest_id is None:
+                latest_id = message.key().id()
+            messages += 1
+            bytes += message.size or 0
+        cursor = query.cursor()
+        if len(batch) < BATCH_SIZE:
+            _reset(account.feedUrl, messages, bytes, latest_id)
+            return cursor, messages, bytes, latest_id, True
+    return cursor, messages, bytes, latest_id, False
+
+def _reset(feed_url, messages, bytes, latest_id):
+    key_names = _key_names(feed_url)
+    shard = FeedCounterShard(key_name=key_names[0], messages=messages, bytes=bytes)
+    latest = latest_id and MailMessage.get_by_id(latest_id)
+    if latest:
+        shard.latestReceived = latest.dateReceived
+        shard.latestId = latest_id
+    db.delete([db.Key.from_path('FeedCounterShard', key_name) for key_name in key_names[1:]])
+    shard.put()
+    memcache.delete(PREFIX + feed_url)
+
+def _key_names(feed_url):
+    return ["%s:%d" % (feed_url, n) for n in range(config.SETTINGS['feed_counter_shards'])]
@@ -0,0 +1,105 @@
+from google.appengine.ext import db
+from libs import PyRSS2Gen
+from util import Templates
+import config, cgi, htmlentitydefs, re
+
+# Each message's RSS <item> and Atom <entry> are rendered once, when the mail
+# arrives, and stored on the MailMessage. Feeds are then built by concatenating
+# the stored fragments. Messages stored before this (or not yet backfilled) are
+# rendered on the fly with the same functions.
+#
+# Summary feeds carry an excerpt instead: the start of the body as plain text,
+# also made at ingest and kept on the MailMessage itself, so they are built
+# without reading a single MailBody. Their items are small enough to render
+# as the feed is.
+
+ENTRY_TEMPLATE = 'view/atom-entry.xml'
+SUMMARY_TEMPLATE = 'view/atom-summary.xml'
+_SCRIPT = re.compile(r'<(script|style|head)\b.*?</\1\s*>', re.I | re.S)
+_BREAK = re.compile(r'<(br|p|div|tr|li|h\d)\b[^>]*>', re.I)
+_TAG = re.compile(r'<[^>]*>')
+_ENTITY = re.compile(r'&(#x[0-9a-f]+|#\d+|\w+);', re.I)
+_SPACE = re.compile(r'\s+', re.U)
+
+def user_link(feed_url):
+    return config.SETTINGS['url'] + "/view/" + feed_url
+
+def atom_footer(feed_url):
+    feed_url_view = "http://"+config.SETTINGS['hostname']+"/view/"+feed_url
+    return "<div style='clear:both;text-align: right; width:100%'><span style='color:#4E83B9'>email<span style='color:#1A4979; font-weight: bold;'>2</span><span style='color:#4E83B9'>feed</span> | <a target='_blank' style='color:#4E83B9;text-decoration: none;' href='" + feed_url_view + "'>settings</a></div>"
+
+def rss_item(message, feed_url):
+    genlink = user_link(feed_url) + "/" + str(message.key().id())
+    item = PyRSS2Gen.RSSItem(title=message.subject,description=message.body,pubDate=message.dateReceived,guid = PyRSS2Gen.Guid(genlink),link=genlink)
+    handler = PyRSS2Gen.StreamHandler()
+    item.publish(handler)
+    return handler.text()
+
+def atom_entry(message, feed_url):
+    entry_data = {
+                  "result"      :   message
+                 ,"userlink"    :   user_link(feed_url)
+                 ,"feedFooter"  :   atom_footer(feed_url)
+                 }
+    return text(Templates.render(ENTRY_TEMPLATE, entry_data))
+
+def rss_summary(message, feed_url):
+    genlink = user_link(feed_url) + "/" + str(message.key().id())
+    item = PyRSS2Gen.RSSItem(title=message.subject,description=summary_html(message, genlink),pubDate=message.dateReceived,guid = PyRSS2Gen.Guid(genlink),link=genlink)
+    handler = PyRSS2Gen.StreamHandler()
+    item.publish(handler)
+    return handler.text()
+
+def atom_summary(message, feed_url):
+    entry_data = {
+                  "result"      :   message
+                 ,"userlink"    :   user_link(feed_url)
+                 ,"summary"     :   summary_html(message, user_link(feed_url) + "/" + str(message.key().id()))
+                 }
+    return text(Templates.render(SUMMARY_TEMPLATE, entry_data))
+
+def summary_html(message, link):
+    """A message's excerpt as HTML, with a link to the whole message"""
+    return u'<p>%s</p><p><a href="%s">Read the whole message</a></p>' % (cgi.escape(summary(message)), link)
+
+def summary(message):
+    """The excerpt of a message, made from its body if it was stored without one"""
+    if message.summary is not None:
+        return message.summary
+    return excerpt(message.body)
+
+def excerpt(body):
+    """The start of a body as plain text, at most SUMMARY_CHARS long"""
+    if not body:
+        return u""
+    limit = config.SETTINGS['summary_chars']
+    value = _TAG.sub(u' ', _BREAK.sub(u' ', _SCRIPT.sub(u' ', body)))
+    value = _SPACE.sub(u' ', _ENTITY.sub(_entity, value)).strip()
+    if len(value) > limit:
+        value = value[:limit].rsplit(u' ', 1)[0] + u"\u2026"
+    return text(value)
+
+def render(message, feed_url):
+    """Stores both fragments and the excerpt on the message, which must already have a key"""
+    message.rssItem = db.Text(rss_item(message, feed_url))
+    message.atomEntry = db.Text(atom_entry(message, feed_url))
+    message.summary = db.Text(excerpt(message.body))
+
+def text(value):
+    # older template versions return utf-8 byte strings
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    return value
+
+def _entity(match):
+    name = match.group(1).lower()
+    try:
+        if name.startswith('#x'):
+            return unichr(int(name[2:], 16))
+        if name.startswith('#'):
+            return unichr(int(name[1:]))
+    except (ValueError, OverflowError):
+        return u' '
+    if name in htmlentitydefs.name2codepoint:
+        return unichr(htmlentitydefs.name2codepoint[name])
+    return match.group(0)
@@ -0,0 +1,169 @@
+from google.appengine.api import memcache, urlfetch
+from google.appengine.ext import db
+from models.models import HubSubscription
+from util import Accounts
+import config, datetime, hashlib, hmac, logging, os, urllib
+try:
+    from google.appengine.api import taskqueue
+except ImportError:
+    from google.appengine.api.labs import taskqueue
+
+# A WebSub (PubSubHubbub) hub for our own feeds, so readers can be told
+# about new mail instead of polling. A subscription request to /hub is
+# verified with the subscriber's callback from a task; after that, every
+# batch of mail stored for a feed schedules one fan-out task, which queues
+# one delivery task per subscriber. Deliveries POST the current feed
+# document and are retried with the 'hub' queue's backoff (queue.yaml), so a
+# failing subscriber never holds up the others.
+
+QUEUE = 'hub'
+HUB_PATH = '/hub'
+VERIFY_URL = '/tasks/hub/verify'
+FANOUT_URL = '/tasks/hub/fanout'
+DELIVER_URL = '/tasks/hub/deliver'
+FANOUT_BATCH = 100 #subscriptions per fan-out task
+FETCH_DEADLINE = 10
+SUBSCRIBED_PREFIX = "hubsubs:" #whether a feed has any subscribers
+STATS_KEY = "hub:stats"
+
+def hub_url():
+    return "http://" + config.SETTINGS['hostname'] + HUB_PATH
+
+def topic(feed_url, format):
+    """The self url of a feed, which subscribers use as the topic"""
+    if format == "rss":
+        return "http://" + config.SETTINGS['hostname'] + "/rss/" + feed_url
+    return "http://" + config.SETTINGS['hostname'] + "/" + feed_url
+
+def parse_topic(topic_url):
+    """(feed url, format) of one of our topics, None for anything else"""
+    prefix = "http://" + config.SETTINGS['hostname'] + "/"
+    if not topic_url.startswith(prefix):
+        return None
+    path = topic_url[len(prefix):]
+    format = "atom"
+    if path.startswith("rss/"):
+        path, format = path[4:], "rss"
+    if not path or "/" in path or "?" in path or not Accounts.by_feed_url(path):
+        return None
+    return path, format
+
+def advertise(handler, topic_url):
+    """Link headers for readers that look there rather than in the document"""
+    handler.response.headers['Link'] = '<%s>; rel="hub", <%s>; rel="self"' % (hub_url(), topic_url)
+
+def request(mode, topic_url, callback, lease_seconds=None, secret=None):
+    """Queues verification of a subscribe or unsubscribe request. Returns an error or None"""
+    if mode not in ("subscribe", "unsubscribe"):
+        return "hub.mode must be subscribe or unsubscribe"
+    if not callback.startswith(("http://", "https://")) or len(callback) > 500:
+        return "hub.callback must be an http(s) url"
+    if not parse_topic(topic_url):
+        return "hub.topic is not a feed of this hub"
+    if secret and len(secret) >= 200:
+        return "hub.secret must be shorter than 200 bytes"
+    try:
+        lease_seconds = int(lease_seconds or config.SETTINGS['hub_lease_seconds'])
+    except ValueError:
+        return "hub.lease_seconds must be a number"
+    lease_seconds = max(60, min(lease_seconds, config.SETTINGS['hub_max_lease_seconds']))
+    taskqueue.Queue(QUEUE).add(taskqueue.Task(url=VERIFY_URL, params={'mode': mode,
+        'topic': topic_url, 'callback': callback, 'lease_seconds': lease_seconds, 'secret': secret or ''}))
+    return None
+
+def verify(mode, topic_url, callback, lease_seconds, secret):
+    """Confirms the request with the subscriber and stores or drops the subscription"""
+    feed = parse_topic(topic_url)
+    if not feed:
+        return False
+    challenge = hashlib.sha1(os.urandom(20)).hexdigest()
+    query = {'hub.mode': mode, 'hub.topic': topic_url, 'hub.challenge': challenge}
+    if mode == "subscribe":
+        query['hub.lease_seconds'] = lease_seconds
+    separator = "?" in callback and "&" or "?"
+    try:
+        response = urlfetch.fetch(callback + separator + urllib.urlencode(query),
+                                  deadline=FETCH_DEADLINE, follow_redirects=False)
+    except urlfetch.Error, e:
+        logging.info("Hub verification of %s failed: %s" % (callback, e))
+        return False
+    if not 200 <= response.status_code < 300 or response.content.strip() != challenge:
+        logging.info("Hub verification of %s refused (%d)" % (callback, response.status_code))
+        return False
+
+    feed_url, format = feed
+    key_name = subscription_key(topic_url, callback)
+    if mode == "subscribe":
+        HubSubscription(key_name=key_name, topic=topic_url, feedUrl=feed_url, format=format,
+                        callback=callback, secret=secret or None,
+                        leaseExpires=datetime.datetime.now() + datetime.timedelta(seconds=int(lease_seconds))).put()
+    else:
+        db.delete(db.Key.from_path('HubSubscription', key_name))
+    memcache.delete(SUBSCRIBED_PREFIX + feed_url)
+    return True
+
+def subscription_key(topic_url, callback):
+    return hashlib.sha1(topic_url.encode('utf-8') + "\0" + callback.encode('utf-8')).hexdigest()
+
+def publish(feed_url):
+    """Called after mail is stored for a feed; fans out if anyone subscribed"""
+    subscribed = memcache.get(SUBSCRIBED_PREFIX + feed_url)
+    if subscribed is None:
+        subscribed = HubSubscription.all(keys_only=True).filter("feedUrl = ", feed_url).get() is not None
+        memcache.set(SUBSCRIBED_PREFIX + feed_url, subscribed)
+    if subscribed:
+        taskqueue.Queue(QUEUE).add(taskqueue.Task(url=FANOUT_URL, params={'feed': feed_url}))
+
+def fanout(feed_url, cursor=None):
+    """Queues a delivery per live subscription, returns the cursor to continue from or None"""
+    query = HubSubscription.all().filter("feedUrl = ", feed_url)
+    if cursor:
+        query.with_cursor(cursor)
+    subscriptions = query.fetch(FANOUT_BATCH)
+    now = datetime.datetime.now()
+    expired = [subscription.key() for subscription in subscriptions if subscription.leaseExpires < now]
+    if expired:
+        db.delete(expired)
+        memcache.delete(SUBSCRIBED_PREFIX + feed_url)
+    tasks = [taskqueue.Task(url=DELIVER_URL, params={'subscription': subscription.key().name()})
+             for subscription in subscriptions if subscription.leaseExpires >= now]
+    if tasks:
+        taskqueue.Queue(QUEUE).add(tasks)
+    _count('fanouts', 1)
+    if len(subscriptions) == FANOUT_BATCH:
+        return query.cursor()
+    return None
+
+def deliver(subscription, document, content_type):
+    """POSTs a feed document to a subscriber. Returns False when it should be retried"""
+    if isinstance(document, unicode):
+        document = document.encode('utf-8')
+    headers = {'Content-Type': content_type,
+               'Link': '<%s>; rel="hub", <%s>; rel="self"' % (hub_url(), subscription.topic)}
+    if subscription.secret:
+        headers['X-Hub-Signature'] = "sha1=" + hmac.new(subscription.secret.encode('utf-8'), document, hashlib.sha1).hexdigest()
+    try:
+        response = urlfetch.fetch(subscription.callback, payload=document, method=urlfetch.POST,
+                                  headers=headers, deadline=FETCH_DEADLINE, follow_redirects=False)
+    except urlfetch.Error, e:
+        logging.info("Hub delivery to %s failed: %s" % (subscription.callback, e))
+        _count('failures', 1)
+        return False
+    if response.status_code == 410: #gone, the subscriber doesn't want it any more
+        subscription.delete()
+        memcache.delete(SUBSCRIBED_PREFIX + subscription.feedUrl)
+        return True
+    if not 200 <= response.status_code < 300:
+        _count('failures', 1)
+        return False
+    _count('deliveries', 1)
+    return True
+
+def _count(name, value):
+    if memcache.incr(STATS_KEY + ":" + name, value) is None:
+        memcache.add(STATS_KEY + ":" + name, value)
+
+def stats():
+    names = ('fanouts', 'deliveries', 'failures')
+    values = memcache.get_multi([STATS_KEY + ":" + name for name in names])
+    return dict([(name, values.get(STATS_KEY + ":" + name, 0)) for name in names])
@@ -0,0 +1,159 @@
+from google.appengine.ext import db
+from models.models import MailMessage
+from util import Accounts, Addresses, Blobs, Dedup, FeedCache, FeedStats, Fragments, Hub, Search
+import calendar, config, hashlib, logging, pickle, time, uuid
+try:
+    from google.appengine.api import taskqueue
+except ImportError:
+    from google.appengine.api.labs import taskqueue
+
+# MailHandler only parses a message and queues it here. A worker task leases
+# the queued messages in batches, resolves each recipient once per batch and
+# stores the whole batch with one datastore put.
+#
+# A batch that fails part way is leased again once its lease runs out,
+# possibly together with other messages, and stored again. Every delivery
+# has an id derived from its pull task and feed (message_id), so the second
+# put overwrites the first, and FeedStats counts each message once.
+
+QUEUE = 'ingest' #pull queue, see queue.yaml
+WORKER_URL = '/tasks/ingest'
+LEASE_SECONDS = 300 #well past what storing a full batch with its search postings takes
+MAX_PAYLOAD = 900 * 1024 #bigger messages don't fit in a task and are stored right away
+WORKER_DEADLINE = 20 #seconds a worker drains before handing over to a new one
+
+def enqueue(pending):
+    """Queues a parsed message (see MailHandler.receive for the fields)"""
+    payload = pickle.dumps(pending, 2)
+    if len(payload) > MAX_PAYLOAD:
+        pending['task'] = uuid.uuid4().hex #no pull task to name it, see message_id
+        store([pending])
+        return
+    taskqueue.Queue(QUEUE).add(taskqueue.Task(payload=payload, method='PULL'))
+    schedule_worker()
+
+def schedule_worker(delay=None):
+    # one worker per time slot; named tasks turn the repeated adds into no-ops
+    if delay is None:
+        delay = config.SETTINGS['ingest_batch_delay']
+    slot = int(time.time() / max(delay, 1))
+    try:
+        taskqueue.add(url=WORKER_URL, name='ingest-%d-%d' % (delay, slot), countdown=delay)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
+def drain():
+    """Stores queued messages batch by batch. Returns (stored, finished)"""
+    queue = taskqueue.Queue(QUEUE)
+    batch_size = config.SETTINGS['ingest_batch_size']
+    deadline = time.time() + WORKER_DEADLINE
+    stored = 0
+    while time.time() < deadline:
+        tasks = queue.lease_tasks(LEASE_SECONDS, batch_size)
+        if tasks:
+            batch = []
+            for task in tasks:
+                pending = pickle.loads(task.payload)
+                pending['task'] = task.name
+                batch.append(pending)
+            store(batch)
+            queue.delete_tasks(tasks)
+            stored += len(tasks)
+        if len(tasks) < batch_size:
+            return stored, True
+    return stored, False
+
+def message_id(pending, feed_url):
+    """The id a delivery is stored under, the same every time its task is retried.
+
+    The second it was received, then 20 bits of a hash of its task name and
+    feed, so ids keep growing over time and stay exact in JavaScript (< 2**53).
+    store() moves a delivery past an id another delivery already has.
+    """
+    received = calendar.timegm(pending['dateReceived'].timetuple())
+    name = "%s %s" % (pending.get('task', ''), feed_url)
+    return received << 20 | int(hashlib.sha1(name.encode('utf-8')).hexdigest()[:5], 16)
+
+def store(batch):
+    """Writes a batch of parsed messages, returns the number stored"""
+    #every recipient in the batch resolved at once, through the cached routing table
+    names = {}
+    for pending in batch:
+        for address in pending['recipients']:
+            names[Addresses.split(address)[0]] = True
+    accounts = Accounts.by_email_names(names.keys())
+
+    deliveries = []
+    for pending in batch:
+        digest = Dedup.fingerprint(pending)
+        delivered = {}
+        for address in pending['recipients']:
+            account = accounts.get(Addresses.split(address)[0])
+            if account and account.feedUrl not in delivered:
+                delivered[account.feedUrl] = True
+                deliveries.append((account, pending, digest))
+        if not delivered:
+            logging.info("Account does not exist for " + ", ".join(pending['recipients']))
+    #copies a feed already got, earlier or in this same batch, are dropped
+    keyed = [(account.feedUrl, digest) for account, pending, digest in deliveries if digest]
+    fresh = Dedup.unseen(keyed)
+    if len(fresh) < len(keyed):
+        logging.info("Dropped %d duplicate deliveries" % (len(keyed) - len(fresh)))
+        wanted = dict([(delivery, True) for delivery in fresh])
+        deliveries = [delivery for delivery in deliveries
+                      if delivery[2] is None or wanted.pop((delivery[0].feedUrl, delivery[2]), False)]
+    if not deliveries:
+        return 0
+
+    #the ids are known up front, so the feed fragments can link to the messages
+    ids = _free_ids(deliveries, [message_id(pending, account.feedUrl) for account, pending, digest in deliveries])
+    messages = []
+    feeds = {}
+    blobs = {} #of the messages stored, the ones spam and duplicates came with are never written
+    for (account, pending, digest), key_id in zip(deliveries, ids):
+        mailMessage = MailMessage(key=db.Key.from_path('MailMessage', key_id))
+        mailMessage.toAddress = account.emailName + config.SETTINGS['emaildomain'] #the address feeds are queried by
+        mailMessage.fromAddress = pending['sender']
+        mailMessage.subject = pending['subject']
+        mailMessage.body = pending['body']
+        mailMessage.size = len(pending['body'] or "")
+        mailMessage.dateSent = pending['dateSent']
+        mailMessage.dateReceived = pending['dateReceived']
+        mailMessage.blobs = Blobs.references(pending['body'])
+        for blob in mailMessage.blobs:
+            if blob in (pending.get('blobs') or {}):
+                blobs[blob] = pending['blobs'][blob]
+        Fragments.render(mailMessage, account.feedUrl)
+        messages.append(mailMessage)
+        feeds.setdefault(account.feedUrl, []).append(mailMessage)
+    #blobs, bodies and search postings first, so a failure in between never
+    #leaves a message without its body, linking to a missing blob or out of search
+    Blobs.store(blobs)
+    db.put([message.content() for message in messages])
+    Search.index([(account.feedUrl, message) for (account, pending, digest), message in zip(deliveries, messages)])
+    db.put(messages)
+    for feed_url, feed_messages in feeds.items():
+        FeedStats.add_messages(feed_url, feed_messages) #once each, however often the batch is stored
+        FeedCache.invalidate(feed_url)
+        Hub.publish(feed_url)
+    Dedup.remember(fresh) #last, so a batch that fails before its totals are counted is retried whole
+    return len(messages)
+
+def _free_ids(deliveries, ids):
+    """ids, each moved up past one an earlier delivery of the batch or a different stored message has.
+
+    A message stored under the id already is this delivery's own from an
+    earlier try when it was received at the same moment for the same feed.
+    """
+    unchecked = range(len(ids))
+    while unchecked:
+        stored = db.get([db.Key.from_path('MailMessage', ids[i]) for i in unchecked])
+        taken = []
+        for i, message in zip(unchecked, stored):
+            account, pending, digest = deliveries[i]
+            if ids[i] in ids[:i] or (message is not None and (message.dateReceived != pending['dateReceived'] or
+                    message.toAddress != account.emailName + config.SETTINGS['emaildomain'])):
+                ids[i] += 1
+                taken.append(i)
+        unchecked = taken
+    return ids
@@ -0,0 +1,143 @@
+from google.appengine.api import apiproxy_stub_map
+from util import Routes
+import config, logging, random, sys, time
+try:
+    import json
+except ImportError:
+    from django.utils import simplejson as json
+
+# Per-request timings for a sample of requests: wall time split into
+# datastore calls, rendering (templates, PyRSS2Gen, feed fragments) and
+# writing the response, plus datastore call count and response bytes.
+# Each sampled request is logged as one "request-stats" JSON line and kept
+# in a rolling window per handler for the percentiles on /stats (this
+# instance only).
+
+FIELDS = ('wall', 'datastore', 'render', 'write', 'other', 'calls', 'bytes')
+WINDOW = 500
+
+current = None #the request being measured, None when not sampled
+windows = {} #handler -> list of recent samples, oldest overwritten first
+sampled = {} #handler -> number of samples taken
+_wrapped = set()
+
+def install(application):
+    """Hooks the datastore and the renderers; application resolves handler names"""
+    global _application
+    _application = application
+    hooks = apiproxy_stub_map.apiproxy
+    hooks.GetPreCallHooks().Append('instrument', _before_call, 'datastore_v3')
+    hooks.GetPostCallHooks().Append('instrument', _after_call, 'datastore_v3')
+    Routes.after_import.append(wrap_renderers) #the renderers load with the handlers that use them
+    wrap_renderers()
+
+def wrap_renderers():
+    """Times the renderers imported so far, each only once"""
+    for module_name, owner_name, name, wrap in (('util.Templates', None, 'render', _timed),
+                                                ('util.Fragments', None, 'rss_item', _timed),
+                                                ('util.Fragments', None, 'atom_entry', _timed),
+                                                ('util.Fragments', None, 'rss_summary', _timed),
+                                                ('util.Fragments', None, 'atom_summary', _timed),
+                                                ('libs.PyRSS2Gen', 'RSS2', 'iter_xml', _timed_iter)):
+        module = sys.modules.get(module_name)
+        if module is None or (module_name, name) in _wrapped:
+            continue
+        owner = owner_name and getattr(module, owner_name) or module
+        setattr(owner, name, wrap(getattr(owner, name)))
+        _wrapped.add((module_name, name))
+
+def call(application, environ, start_response):
+    """Runs one request through the application, measuring it if sampled"""
+    global current
+    if random.random() >= config.SETTINGS['instrument_sample_rate']:
+        return application(environ, start_response)
+
+    current = {'datastore': 0.0, 'render': 0.0, 'write': 0.0, 'calls': 0, 'bytes': 0, 'depth': 0}
+    started = time.time()
+    def timed_start_response(status, headers, exc_info=None):
+        write = start_response(status, headers, exc_info)
+        def timed_write(data):
+            begin = time.time()
+            write(data)
+            if current is not None:
+                current['write'] += time.time() - begin
+                current['bytes'] += len(data)
+        return timed_write
+    try:
+        result = list(application(environ, timed_start_response))
+        for chunk in result:
+            current['bytes'] += len(chunk)
+        return result
+    finally:
+        sample, current = current, None
+        sample['wall'] = time.time() - started
+        sample['other'] = max(sample['wall'] - sample['datastore'] - sample['render'] - sample['write'], 0.0)
+        del sample['depth']
+        _record(handler_name(environ.get('PATH_INFO', '')), sample)
+
+def handler_name(path):
+    for regexp, handler in _application._url_mapping:
+        if regexp.match(path):
+            return handler.__module__.split('.')[-1] + "." + handler.__name__
+    return "unmatched"
+
+def percentiles():
+    """{handler: {field: (p50, p90, p99)}} over each handler's window"""
+    result = {}
+    for handler, samples in windows.items():
+        result[handler] = {}
+        for field in FIELDS:
+            values = [sample[field] for sample in samples]
+            values.sort()
+            result[handler][field] = tuple([values[min(int(len(values) * p), len(values) - 1)]
+                                            for p in (0.5, 0.9, 0.99)])
+    return result
+
+def _record(handler, sample):
+    logging.info("request-stats " + json.dumps({'handler': handler, 'stats': sample}))
+    window = windows.setdefault(handler, [])
+    count = sampled.get(handler, 0)
+    if len(window) < WINDOW:
+        window.append(sample)
+    else:
+        window[count % WINDOW] = sample
+    sampled[handler] = count + 1
+
+def _before_call(service, call, request, response):
+    if current is not None:
+        current['calls'] += 1
+        current['call_started'] = time.time()
+
+def _after_call(service, call, request, response):
+    if current is not None and 'call_started' in current:
+        current['datastore'] += time.time() - current.pop('call_started')
+
+def _timed(function):
+    # nested renders (a template inside a fragment) are only counted once
+    def timed(*args, **kwargs):
+        if current is None:
+            return function(*args, **kwargs)
+        current['depth'] += 1
+        begin = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            if current is not None:
+                current['depth'] -= 1
+                if current['depth'] == 0:
+                    current['render'] += time.time() - begin
+    return timed
+
+def _timed_iter(function):
+    def timed(*args, **kwargs):
+        iterator = function(*args, **kwargs)
+        while True:
+            begin = time.time()
+            try:
+                chunk = iterator.next()
+            except StopIteration:
+                return
+            if current is not None:
+                current['render'] += time.time() - begin
+            yield chunk
+    return timed
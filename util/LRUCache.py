@@ -0,0 +1,104 @@
+import threading, time
+
+class LRUCache():
+    """Bounded in-process cache with least-recently-used eviction.
+
+    Entries are evicted once either max_entries or max_bytes is exceeded.
+    The size of an entry is len(value) unless a size is passed to put().
+    With a ttl (in seconds) entries also expire that long after being put.
+    """
+    def __init__(self, max_entries=100, max_bytes=None, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.map = {}
+            # circular doubly linked list: [prev, next, key, value, size, expires]
+            self.root = root = []
+            root[:] = [root, root, None, None, 0, None]
+            self.bytes = 0
+            self.hits = self.misses = self.evictions = 0
+        finally:
+            self.lock.release()
+
+    def get(self, key, default=None):
+        self.lock.acquire()
+        try:
+            link = self.map.get(key)
+            if link is not None and link[5] is not None and link[5] < time.time():
+                self._unlink(link)
+                del self.map[key]
+                self.bytes -= link[4]
+                link = None
+            if link is None:
+                self.misses += 1
+                return default
+            self._unlink(link)
+            self._append(link)
+            self.hits += 1
+            return link[3]
+        finally:
+            self.lock.release()
+
+    def put(self, key, value, size=None):
+        if size is None:
+            size = len(value)
+        expires = None
+        if self.ttl is not None:
+            expires = time.time() + self.ttl
+        self.lock.acquire()
+        try:
+            link = self.map.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+                self.bytes -= link[4]
+            if self.max_bytes is not None and size > self.max_bytes:
+                return #never fits, don't flush the whole cache for it
+            link = [None, None, key, value, size, expires]
+            self._append(link)
+            self.map[key] = link
+            self.bytes += size
+            while len(self.map) > self.max_entries or \
+                    (self.max_bytes is not None and self.bytes > self.max_bytes):
+                oldest = self.root[1]
+                self._unlink(oldest)
+                del self.map[oldest[2]]
+                self.bytes -= oldest[4]
+                self.evictions += 1
+        finally:
+            self.lock.release()
+
+    def delete(self, key):
+        self.lock.acquire()
+        try:
+            link = self.map.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+                self.bytes -= link[4]
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        return {
+            'entries': len(self.map),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def _append(self, link):
+        last = self.root[0]
+        link[0] = last
+        link[1] = self.root
+        last[1] = link
+        self.root[0] = link
+
+    def _unlink(self, link):
+        link[0][1] = link[1]
+        link[1][0] = link[0]
@@ -1,73 +1,35 @@
 from google.appengine.ext.webapp.mail_handlers import InboundMailHandler
-from models.models import UserDetails, TrustedEmails, BlockedEmails
-from google.appengine.api.mail import EncodedPayload
-from models.models import MailMessage
-import logging, datetime, re
+from util import Addresses, Blobs, Ingest, MimeBody
+import config, logging, datetime, urllib
 
 class MailHandler(InboundMailHandler):
     def receive(self, message):
         logging.info("Message from: " + message.sender + " to: " + message.to)
         original = message.original
 
-        fromEmail = message.sender
-        to = message.to   
-        blocked = trusted = accountExists = blockMode = False        
-        
-        m = re.search("(?<=\<)(.*?)(?=\>)", to) #serching for gmail formatted emails. ex: 'user <user@example.com>'
-        if m: #gmail format
-            to = m.group()
-                              
-        emailName, emailDomain = to.split("@")        
+        #one POST per envelope recipient, so To/Cc are not routed here: a message
+        #to a@ and b@ arrives once for each and would be stored twice per feed
+        envelope = urllib.unquote(self.request.path.split('/')[-1]) #/_ah/mail/<address>
+        recipients = Addresses.route(envelope, *original.get_all('X-Forwarded-To', []))
 
-        fm = re.search("(?<=\<)(.*?)(?=\>)", fromEmail) #serching for gmail formatted emails. ex: 'user <user@example.com>'
-        if fm: #gmail format
-            fromEmail = fm.group()
-        
-            
-        existingUsers = UserDetails.gql("WHERE emailName = :1 LIMIT 1",emailName) 
-        for existingUser in existingUsers:        
-                accountExists = True
-                blockMode = existingUser.trustedMode
-
-        logging.info("Forwarder start")
-        if original.has_key('X-Forwarded-To'):
-                logging.info("Forwarder hit")
-                forwardEmail = original.get('X-Forwarded-To')
-                to = forwardEmail
-                emailName, emailDomain = forwardEmail.split("@")
-                logging.info("Forwarder: " + str(forwardEmail) + " :: to " + emailName)
-                existingUsers2 = UserDetails.gql("WHERE emailName = :1 LIMIT 1",str(emailName))
-                for existingUser2 in existingUsers2:
-                        accountExists = True
-                        blockMode = existingUser2.trustedMode
-                        accountName = existingUser2.accountName
-                        logging.info("Account Exists via Forward: " + str(emailName))
-                        fromEmail = emailName
-
-            
-        if accountExists:     
-                mailMessage = MailMessage()
-                mailMessage.toAddress = to
-                mailMessage.fromAddress = message.sender
-                mailMessage.subject = message.subject
-                mailMessage.body = self._getBody(message)
-                mailMessage.dateSent = message.date
-                mailMessage.dateReceived = datetime.datetime.now()
-                mailMessage.put()            
-        else: 
-            logging.info("Account does not exist " + message.to + " with an email name of " + emailName)
+        #parse only; the account lookup and the writes happen in batches, see util/Ingest.py
+        body, blobs = self._getBody(message)
+        pending = {
+                   'recipients'     :   recipients
+                  ,'sender'         :   message.sender
+                  ,'messageId'      :   original.get('Message-ID', '').strip()
+                  ,'subject'        :   message.subject
+                  ,'body'           :   body
+                  ,'blobs'          :   blobs
+                  ,'dateSent'       :   message.date
+                  ,'dateReceived'   :   datetime.datetime.now()
+                  }
+        Ingest.enqueue(pending)
     
     def _getBody(self, message):
-        ret = None
-        for contentType, body in message.bodies():
-            if (contentType == 'text/html'):
-                ret = body
-                break
-            if (contentType == 'text/plain'):
-                ret = body
-        if isinstance(ret, EncodedPayload):            
-            if ret.encoding == '8bit':
-                ret.encoding = '7bit' 
-            
-            ret = ret.decode()
-        return ret
\ No newline at end of file
+        #(body, blobs): images and attachments go to util/Blobs.py, the body links to them.
+        #The blobs are written with the message, so mail nobody gets leaves none behind
+        blobs = {}
+        body = MimeBody.extract(message.original, config.SETTINGS['max_body_size'],
+                                lambda text: Blobs.inline_data(text, blobs))
+        return Blobs.offload(body, message.original, blobs), blobs
\ No newline at end of file
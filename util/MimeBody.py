@@ -0,0 +1,149 @@
+import binascii, codecs
+
+# Picks the one text body we store from an email.message.Message without
+# decoding anything else: the first text/html part wins, otherwise the first
+# text/plain part. The chosen part is decoded a line batch at a time and
+# stops once max_size characters are reached. Images and attachments are
+# only decoded by parts(), for util/Blobs.py, and only up to a size.
+
+TRUNCATED_HTML = u"<p>[message truncated]</p>"
+TRUNCATED_TEXT = u"\n[message truncated]"
+CHUNK_LINES = 256
+MAX_HELD = 2 * 1024 * 1024 #longest data: URI held back for rewrite, longer ones are left as they are
+
+def extract(message, max_size, rewrite=None):
+    """Returns the body as unicode, or None when there is no text body
+
+    rewrite, if given, is applied to the text as it is decoded, before it
+    counts towards max_size. It is never handed a piece of text that ends
+    inside a "data:" URI it could still complete.
+    """
+    part = _body_part(message)
+    if part is None:
+        return None
+    if part.get_content_type() == 'text/html':
+        return _decode(part, max_size, TRUNCATED_HTML, rewrite)
+    return _decode(part, max_size, TRUNCATED_TEXT, rewrite)
+
+def is_html(message):
+    """True when the body extract() returns is HTML"""
+    part = _body_part(message)
+    return part is not None and part.get_content_type() == 'text/html'
+
+def parts(message, max_bytes):
+    """(content id, file name, content type, size, data) of every part other than the text
+
+    data is None for parts bigger than max_bytes, which aren't decoded;
+    their size is then estimated from the encoded length.
+    """
+    for part in message.walk():
+        if part.is_multipart():
+            continue
+        if part.get_content_maintype() == 'text' and not _is_attachment(part):
+            continue
+        content_id = part.get('Content-ID', '').strip().strip('<>') or None
+        payload = part.get_payload()
+        if not isinstance(payload, str):
+            payload = str(payload)
+        size = len(payload)
+        if part.get('Content-Transfer-Encoding', '').strip().lower() == 'base64':
+            size = size * 3 / 4
+        data = None
+        if size <= max_bytes:
+            data = part.get_payload(decode=True) or ''
+            size = len(data)
+            if size > max_bytes:
+                data = None
+        yield content_id, part.get_filename(), part.get_content_type(), size, data
+
+def _body_part(message):
+    plain = None
+    for part in message.walk():
+        if part.is_multipart() or _is_attachment(part):
+            continue
+        content_type = part.get_content_type()
+        if content_type == 'text/html':
+            return part
+        if content_type == 'text/plain' and plain is None:
+            plain = part
+    return plain
+
+def _is_attachment(part):
+    disposition = part.get('Content-Disposition', '').split(';')[0].strip().lower()
+    return disposition == 'attachment' or (disposition != 'inline' and part.get_filename() is not None)
+
+def _decode(part, max_size, marker, rewrite=None):
+    charset = _charset(part)
+    decoder = codecs.getincrementaldecoder(charset)('replace')
+    transfer = part.get('Content-Transfer-Encoding', '').strip().lower()
+    payload = part.get_payload()
+    if not isinstance(payload, str):
+        payload = str(payload)
+
+    pieces = []
+    size = 0
+    truncated = False
+    held = u"" #a data: URI that may continue in the next chunk
+    for encoded in _chunks(payload):
+        if transfer == 'base64':
+            try:
+                raw = binascii.a2b_base64(encoded)
+            except binascii.Error:
+                raw = ''
+        elif transfer == 'quoted-printable':
+            raw = binascii.a2b_qp(encoded)
+        else: #7bit, 8bit and binary are stored as is
+            raw = encoded
+        text = held + decoder.decode(raw)
+        held = u""
+        if rewrite is not None:
+            start = text.rfind(u"data:")
+            if start == -1 or len(text) - start >= MAX_HELD:
+                start = max(len(text) - 4, 0) #"data" may end this chunk and ":" start the next
+            text, held = text[:start], text[start:]
+            text = rewrite(text)
+        if size + len(text) > max_size:
+            text = text[:max_size - size]
+            if marker is TRUNCATED_HTML and text.rfind(u"<") > text.rfind(u">"):
+                text = text[:text.rfind(u"<")] #don't leave half a tag behind
+            pieces.append(text)
+            truncated = True
+            break
+        pieces.append(text)
+        size += len(text)
+    if not truncated:
+        text = held + decoder.decode('', True)
+        if rewrite is not None:
+            text = rewrite(text)
+        if size + len(text) > max_size:
+            text = text[:max_size - size]
+            if marker is TRUNCATED_HTML and text.rfind(u"<") > text.rfind(u">"):
+                text = text[:text.rfind(u"<")]
+            truncated = True
+        pieces.append(text)
+    if truncated:
+        pieces.append(marker)
+    return u"".join(pieces)
+
+def _chunks(payload):
+    # whole lines only, so base64 quads and quoted-printable soft breaks stay intact
+    start = 0
+    while start < len(payload):
+        end = start
+        for i in range(CHUNK_LINES):
+            end = payload.find('\n', end) + 1
+            if end == 0:
+                end = len(payload)
+                break
+        yield payload[start:end]
+        start = end
+
+def _charset(part):
+    charset = part.get_content_charset() or 'us-ascii'
+    try:
+        codecs.lookup(charset)
+    except LookupError:
+        charset = 'latin-1' #unknown charsets decode without errors this way
+    if charset in ('us-ascii', 'ascii'):
+        charset = 'latin-1' #8bit bytes labelled ascii are common
+    return charset
@@ -0,0 +1,97 @@
+from google.appengine.ext import db
+from google.appengine.api import memcache
+from models.models import MailMessage, MailBody
+from util import Blobs, FeedCache, FeedStats, Search
+import config, datetime, logging, time
+
+# Deletes messages that fall outside a feed's retention policy: more than
+# max messages, older than max days, or past max bytes counting from the
+# newest message. Runs from the task queue (see controllers/Tasks.Compact),
+# never from MailHandler. The images and attachments only deleted messages
+# linked to go with them (see util/Blobs.py), and the messages are taken out
+# of search (see util/Search.py).
+
+BATCH_SIZE = 200
+STATS_KEY = "retention:last"
+
+def policy(account):
+    """(max messages, max age in days, max bytes) for an account, None means no limit"""
+    def pick(override, default):
+        if override is not None:
+            return override
+        return default
+    return (pick(account.retainMessages, config.SETTINGS['retain_messages']),
+            pick(account.retainDays, config.SETTINGS['retain_days']),
+            pick(account.retainBytes, config.SETTINGS['retain_bytes']))
+
+def compact(account, deadline, cursor=None, seen=0, kept_bytes=0):
+    """Walks one account's messages newest first, deleting those outside its policy.
+
+    Stops at the deadline. Returns (cursor, seen, kept_bytes, deleted, finished);
+    pass the first three back in to resume.
+    """
+    max_messages, max_days, max_bytes = policy(account)
+    if max_messages is None and max_days is None and max_bytes is None:
+        return None, seen, kept_bytes, 0, True
+    cutoff = None
+    if max_days is not None:
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=max_days)
+
+    query = MailMessage.all().filter("toAddress = ", account.emailName + config.SETTINGS['emaildomain']).order("-dateReceived")
+    if cursor:
+        query.with_cursor(cursor)
+    deleted = 0
+    while time.time() < deadline:
+        messages = query.fetch(BATCH_SIZE)
+        doomed = []
+        doomed_messages = []
+        doomed_bytes = 0
+        doomed_blobs = []
+        for message in messages:
+            seen += 1
+            size = message.size or 0
+            over_bytes = max_bytes is not None and kept_bytes + size > max_bytes
+            if over_bytes:
+                kept_bytes = max_bytes + 1 #saturated: once over the budget, every older message goes too
+            if (max_messages is not None and seen > max_messages) or \
+                    (cutoff is not None and message.dateReceived < cutoff) or over_bytes:
+                doomed.append(message.key())
+                doomed.append(MailBody.key_for(message))
+                doomed.append(FeedStats.counted_key(account.feedUrl, message.key().id()))
+                doomed_messages.append(message)
+                doomed_bytes += size
+                doomed_blobs.extend(message.blobs)
+            else:
+                kept_bytes += size
+        if doomed:
+            MailMessage.load_content(doomed_messages, True) #their terms, for Search.unindex
+            db.delete(doomed)
+            Search.unindex([(account.feedUrl, message) for message in doomed_messages])
+            deleted += len(doomed_messages)
+            FeedStats.add(account.feedUrl, -len(doomed_messages), -doomed_bytes)
+            Blobs.release(doomed_blobs)
+        cursor = query.cursor()
+        if len(messages) < BATCH_SIZE:
+            if deleted:
+                FeedCache.invalidate(account.feedUrl)
+            return cursor, seen, kept_bytes, deleted, True
+    if deleted:
+        FeedCache.invalidate(account.feedUrl)
+    return cursor, seen, kept_bytes, deleted, False
+
+def record(scanned, deleted, seconds):
+    """Adds a task's work to the running totals shown on /stats"""
+    stats = memcache.get(STATS_KEY) or {'scanned': 0, 'deleted': 0, 'seconds': 0.0}
+    stats['scanned'] += scanned
+    stats['deleted'] += deleted
+    stats['seconds'] += seconds
+    memcache.set(STATS_KEY, stats)
+    if seconds:
+        logging.info("Retention: scanned %d, deleted %d messages in %.1fs (%.0f messages/s)" % (
+            scanned, deleted, seconds, scanned / seconds))
+
+def start():
+    memcache.set(STATS_KEY, {'scanned': 0, 'deleted': 0, 'seconds': 0.0})
+
+def stats():
+    return memcache.get(STATS_KEY) or {}
@@ -0,0 +1,40 @@
+import sys, time
+
+# Handlers named by dotted path instead of imported up front: a handler's
+# module is imported on the first request routed to it, so a new instance
+# only loads the controller (and the libraries behind it) that its first
+# request needs. webapp only calls a handler class to make the handler and
+# reads its name, which Handler stands in for.
+
+loaded = {} #module -> seconds its import took on this instance
+after_import = [] #called with no arguments after each handler module is imported
+_handlers = {}
+
+class Handler():
+    def __init__(self, path):
+        self.__module__, self.__name__ = path.rsplit('.', 1)
+        self._class = None
+
+    def __call__(self):
+        if self._class is None:
+            self._class = load(self.__module__, self.__name__)
+        return self._class()
+
+def handler(path):
+    """The lazy handler for 'package.module.Class', one per path"""
+    if path not in _handlers:
+        _handlers[path] = Handler(path)
+    return _handlers[path]
+
+def mapping(routes):
+    """[(regexp, handler path)] as webapp's url mapping"""
+    return [(regexp, handler(path)) for regexp, path in routes]
+
+def load(module_name, class_name):
+    if module_name not in sys.modules:
+        started = time.time()
+        __import__(module_name)
+        loaded[module_name] = time.time() - started
+        for function in after_import:
+            function()
+    return getattr(sys.modules[module_name], class_name)
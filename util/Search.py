@@ -0,0 +1,161 @@
+from google.appengine.ext import db
+from models.models import SearchPostings
+from util import FeedStats
+import hashlib, heapq, logging, math, re, time
+try:
+    from google.appengine.api import taskqueue
+except ImportError:
+    from google.appengine.api.labs import taskqueue
+
+# Full-text search over each feed's messages. As mail is stored, the
+# subject, sender and text of the body (tags stripped) are split into terms,
+# and for every feed and term the ids of the messages containing it are
+# written as a new posting segment: one SearchPostings per term per ingest
+# batch, never updated in place, so concurrent writers can't lose each
+# other's postings. A query reads the segments of its terms with one IN
+# query, intersects them and ranks the matches by tf-idf (newest first on
+# ties); only the page shown is fetched. Terms that pile up segments are
+# merged back into one by a task, which also drops deleted messages.
+# Retention takes the messages it deletes out right away with tombstone
+# segments, whose weights are 0, so they never count or take a slot before
+# the merge.
+
+MERGE_URL = '/tasks/search-merge'
+MAX_TERMS = 400 #distinct terms indexed per message, the heaviest
+BODY_CHARS = 50000 #of body text indexed per message
+MAX_QUERY_TERMS = 10
+MERGE_AT = 20 #segments a term collects before it's merged
+MAX_POSTINGS = 50000 #ids kept per term when merging, the newest
+SEGMENT_POSTINGS = 10000 #ids per merged segment, well within the 1MB entity limit
+WEIGHTS = (('subject', 3), ('fromAddress', 2), ('body', 1))
+
+_SCRIPT = re.compile(r'<(script|style)\b.*?</\1\s*>', re.I | re.S)
+_TAG = re.compile(r'<[^>]*>')
+_ENTITY = re.compile(r'&#?\w+;')
+_WORD = re.compile(r'\w+', re.U)
+STOPWORDS = frozenset("""a an and are as at be but by for from has have i in is it its
+    not of on or our that the this to was we were will with you your""".split())
+
+stats = {'indexed': 0, 'segments': 0, 'queries': 0, 'query_seconds': 0.0}
+
+def terms(text):
+    """Lowercase terms of some text or HTML, in order, without stopwords"""
+    if not text:
+        return []
+    text = _ENTITY.sub(' ', _TAG.sub(' ', _SCRIPT.sub(' ', text)))
+    return [word for word in _WORD.findall(text.lower()) if 1 < len(word) <= 30 and word not in STOPWORDS]
+
+def weights(message):
+    """{term: weight} for a message, a term counting more in the subject than in the body"""
+    found = {}
+    for field, weight in WEIGHTS:
+        text = getattr(message, field) or ""
+        for term in terms(text[:BODY_CHARS]):
+            found[term] = found.get(term, 0) + weight
+    if len(found) > MAX_TERMS:
+        found = dict(heapq.nlargest(MAX_TERMS, found.items(), key=lambda item: item[1]))
+    return found
+
+def index(deliveries):
+    """Adds stored messages to the index, deliveries is [(feed url, message)]"""
+    _write(deliveries, False)
+    stats['indexed'] += len(deliveries)
+
+def unindex(deliveries):
+    """Takes deleted messages out of the index, deliveries is [(feed url, message)] with bodies loaded"""
+    _write(deliveries, True)
+
+def _write(deliveries, tombstones):
+    postings = {}
+    for feed_url, message in deliveries:
+        message_id = message.key().id()
+        for term, weight in weights(message).items():
+            ids, term_weights = postings.setdefault(_term_key(feed_url, term), ([], []))
+            ids.append(message_id)
+            term_weights.append(not tombstones and weight or 0)
+    segments = [SearchPostings(term=term, ids=ids, weights=term_weights) for term, (ids, term_weights) in postings.items()]
+    for start in range(0, len(segments), 500): #datastore batch limit
+        db.put(segments[start:start + 500])
+    stats['segments'] += len(segments)
+
+def search(feed_url, query, offset=0, limit=25):
+    """(number of matches, ids of the matches from offset to offset + limit, best first)
+
+    A message matches when it has every term of the query.
+    """
+    started = time.time()
+    keys = []
+    for term in terms(query):
+        if _term_key(feed_url, term) not in keys:
+            keys.append(_term_key(feed_url, term))
+    keys = keys[:MAX_QUERY_TERMS]
+    if not keys:
+        return 0, []
+    postings = dict([(key, {}) for key in keys])
+    segments = {}
+    deleted = {}
+    for segment in SearchPostings.gql("WHERE term IN :1", keys):
+        found = postings[segment.term]
+        for message_id, weight in zip(segment.ids, segment.weights):
+            if weight:
+                found[message_id] = max(found.get(message_id, 0), weight) #indexed twice is harmless
+            else: #tombstone
+                deleted[message_id] = True
+        segments[segment.term] = segments.get(segment.term, 0) + 1
+    for found in postings.values():
+        for message_id in deleted:
+            found.pop(message_id, None)
+    for key, count in segments.items():
+        if count >= MERGE_AT:
+            schedule_merge(key)
+
+    # intersect from the rarest term, then score what's left
+    ordered = sorted(postings.values(), key=len)
+    matches = [message_id for message_id in ordered[0] if all(message_id in found for found in ordered[1:])]
+    total = max(FeedStats.get(feed_url)['messages'], max([len(found) for found in ordered]), 1)
+    idf = [(found, math.log(1.0 + float(total) / len(found))) for found in ordered if found]
+    def score(message_id):
+        return (sum([found[message_id] * weight for found, weight in idf]), message_id) #ids grow over time
+    page = heapq.nlargest(offset + limit, matches, key=score)[offset:]
+    stats['queries'] += 1
+    stats['query_seconds'] += time.time() - started
+    return len(matches), page
+
+def schedule_merge(term_key):
+    # one merge per term every ten minutes at most
+    name = "search-merge-%s-%d" % (hashlib.sha1(term_key.encode('utf-8')).hexdigest()[:20], int(time.time() / 600))
+    try:
+        taskqueue.add(url=MERGE_URL, name=name, params={'term': term_key})
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
+def merge(term_key):
+    """Replaces a term's segments with as few as fit, without the messages deleted since"""
+    segments = SearchPostings.all().filter("term = ", term_key).fetch(1000)
+    if len(segments) < 2:
+        return
+    combined = {}
+    deleted = {}
+    for segment in segments:
+        for message_id, weight in zip(segment.ids, segment.weights):
+            if weight:
+                combined[message_id] = max(combined.get(message_id, 0), weight)
+            else: #tombstone, see unindex
+                deleted[message_id] = True
+    ids = sorted([message_id for message_id in combined if message_id not in deleted], reverse=True)
+    live = []
+    for start in range(0, len(ids), 1000):
+        keys = [db.Key.from_path('MailMessage', message_id) for message_id in ids[start:start + 1000]]
+        live.extend([key.id() for key, message in zip(keys, db.get(keys)) if message is not None])
+        if len(live) >= MAX_POSTINGS:
+            break
+    live = live[:MAX_POSTINGS]
+    #the merged segments go in before the old ones go, so no query misses them
+    for start in range(0, len(live), SEGMENT_POSTINGS): #one at a time, each close to the call size limit
+        chunk = live[start:start + SEGMENT_POSTINGS]
+        SearchPostings(term=term_key, ids=chunk, weights=[combined[message_id] for message_id in chunk]).put()
+    db.delete(segments)
+    logging.info("Merged %d segments of %s, %d of %d postings kept" % (len(segments), term_key, len(live), len(ids)))
+
+def _term_key(feed_url, term):
+    return feed_url + " " + term #feed urls have no spaces
@@ -0,0 +1,18 @@
+from google.appengine.ext.webapp import template
+from django.template import Context #importing template above sets django up
+import config, os
+
+# Views are compiled once per process and kept by their name under views/,
+# e.g. render('view/web.html', view_data). webapp's template.render works out
+# the absolute path and looks it up in its own cache on every call.
+
+_compiled = {}
+
+def get(name):
+    compiled = _compiled.get(name)
+    if compiled is None:
+        compiled = _compiled[name] = template.load(os.path.join(config.APP_ROOT_DIR, 'views', name))
+    return compiled
+
+def render(name, view_data):
+    return get(name).render(Context(view_data))